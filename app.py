@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
-import os, re, json, time, hmac, hashlib, logging, threading
+if __name__ == "__main__":
+    # 직접 실행 시 gevent 패치는 다른 import 보다 먼저 (gunicorn -k gevent 는 워커가 패치)
+    from gevent import monkey
+    monkey.patch_all()
+
+import os, re, json, time, hmac, hashlib, logging, threading, socket
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
-from urllib.parse import urlencode, parse_qs
+from functools import lru_cache
+from urllib.parse import urlencode, quote_plus, unquote_plus
 from typing import Any, Dict, List, Optional, Tuple
 
+import orjson
 import requests
-from flask import Flask, request, jsonify
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+from flask import Flask, request, jsonify, g, has_app_context
 
 app = Flask(__name__)
 app.config["JSON_AS_ASCII"] = False
@@ -13,9 +24,9 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(
 
 KST = timezone(timedelta(hours=9))
 UTC = timezone.utc
-LOCK = threading.Lock()
+LOCK = threading.Lock()  # Redis 미설정 시 lease fallback 전용
 
-# Redis 장애/웹훅 plain-text 상황에서도 동작하도록 메모리 보조 캐시
+# 스로틀 key -> 만료 ts. Redis 보다 먼저 보는 메모리 캐시 (Redis 장애 시 fallback 겸용)
 MEM_THROTTLE: Dict[str, int] = {}
 
 # ===== ENV =====
@@ -33,7 +44,7 @@ BOT_TOKEN_POSITION = E("BOT_TOKEN_POSITION", BOT_TOKEN)
 
 CHAT_IDS = [x.strip() for x in E("CHAT_IDS").split(",") if x.strip()]
 CHAT_IDS_POSITION = [x.strip() for x in E("CHAT_IDS_POSITION").split(",") if x.strip()]
-ADMIN_USER_IDS = set(x.strip() for x in E("ADMIN_USER_IDS").split(",") if x.strip())
+ADMIN_USER_IDS = frozenset(x.strip() for x in E("ADMIN_USER_IDS").split(",") if x.strip())
 
 TV_WEBHOOK_SECRET = E("TV_WEBHOOK_SECRET")
 TG_CONTROL_SECRET = E("TG_CONTROL_SECRET")
@@ -54,8 +65,43 @@ REPORT_AUTO_CHAT_DEFAULT = E("REPORT_AUTO_CHAT")
 
 TAKER_FEE_RATE = float(E("TAKER_FEE_RATE", "0.0005"))
 TIMEOUT = Ei("REQUEST_TIMEOUT", 15)
+TG_FANOUT_WAIT = Ei("TG_FANOUT_WAIT", 5)
+TG_RATE_PER_SEC = Ei("TG_RATE_PER_SEC", 25)   # bot 당 초당 발송 (Telegram 전역 한도 30msg/s 아래)
+TG_CHAT_GAP_MS = Ei("TG_CHAT_GAP_MS", 1000)   # 같은 chat 연속 발송 간격 (chat 당 1msg/s)
+POSITIONS_INTERVAL_SEC = Ei("POSITIONS_INTERVAL_SEC", 0)  # >0 이면 백그라운드에서 주기 실행 (0 = /positions_check 호출 시에만)
+
+# ===== HTTP =====
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    커넥션 풀 + TCP keepalive (Telegram/Upstash/BingX TLS 소켓 재사용)
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super().init_poolmanager(*args, **kwargs)
+
+def http_session(headers: Optional[Dict[str, str]] = None) -> requests.Session:
+    s = requests.Session()
+    # POST는 Retry 기본값상 연결 실패에만 재시도 (중복 발송 방지), 최종 응답은 호출부에서 status 로깅
+    # Retry-After 는 무시 (429 에 긴 값이 오면 webhook/백그라운드 tick 이 TIMEOUT 이상 멈춤) -> 간격은 backoff_factor 로만
+    retry = Retry(
+        total=2, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False, respect_retry_after_header=False,
+    )
+    ad = KeepAliveAdapter(pool_connections=32, pool_maxsize=64, max_retries=retry)
+    s.mount("https://", ad)
+    s.mount("http://", ad)
+    if headers:
+        s.headers.update(headers)
+    return s
+
+_TG_SESSION = http_session({"Content-Type": "application/json"})
+_UPSTASH_SESSION = http_session({"Authorization": f"Bearer {UPSTASH_TOKEN}", "Content-Type": "application/json"})
+_BINGX_SESSION = http_session({"X-BX-APIKEY": BINGX_API_KEY})
 
 # ===== Utils =====
+_NON_ALNUM = re.compile(r"[^A-Za-z0-9]")
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
 def now_kst() -> datetime:
     return datetime.now(tz=KST)
 
@@ -70,10 +116,16 @@ def hm(dt: datetime) -> str:
     return dt.astimezone(KST).strftime("%m-%d %H:%M")
 
 def asf(v: Any, d: float = 0.0) -> float:
+    # 이미 숫자인 경우(템플릿/리포트 대부분) str 왕복 없이 바로 리턴
+    t = type(v)
+    if t is float:
+        return v
     try:
-        if v is None or isinstance(v, bool):
+        if t is int:
+            return float(v)
+        if v is None or t is bool:
             return d
-        return float(str(v).replace(",", "").strip())
+        return float((v if t is str else str(v)).replace(",", "").strip())
     except:
         return d
 
@@ -83,18 +135,33 @@ def asi(v: Any, d: int = 0) -> int:
     except:
         return d
 
-def iso_parse(s: str) -> Optional[datetime]:
+@lru_cache(maxsize=4096)
+def _iso_parse_str(s: str) -> Optional[datetime]:
     try:
-        if not s:
-            return None
-        if s.endswith("Z"):
-            s = s[:-1] + "+00:00"
-        return datetime.fromisoformat(s)
-    except:
+        return datetime.fromisoformat(s[:-1] + "+00:00" if s[-1] == "Z" else s)
+    except ValueError:
+        return None
+
+def iso_parse(s: str) -> Optional[datetime]:
+    # 리포트마다 같은 start_ts/close_ts 를 반복 파싱 -> 결과(불변 datetime) 캐시
+    if not s or type(s) is not str:
         return None
+    return _iso_parse_str(s)
+
+# orjson: compact + UTF-8 (ensure_ascii=False) 출력이 기본값
+def sjsonb(x: Any) -> bytes:
+    return orjson.dumps(x, option=orjson.OPT_NON_STR_KEYS)
 
 def sjson(x: Any) -> str:
-    return json.dumps(x, ensure_ascii=False, separators=(",", ":"))
+    return sjsonb(x).decode("utf-8")
+
+def jloads(s: Any) -> Any:
+    # orjson 우선, NaN/Infinity 등 비표준 JSON 은 stdlib 로 재시도
+    # (TV placeholder 값 / 예전 json.dumps 로 Redis 에 저장된 값 대응)
+    try:
+        return orjson.loads(s)
+    except orjson.JSONDecodeError:
+        return json.loads(s)
 
 def pjson(s: Any, d: Any):
     try:
@@ -102,29 +169,33 @@ def pjson(s: Any, d: Any):
             return d
         if isinstance(s, (dict, list)):
             return s
-        return json.loads(s)
+        return jloads(s)
     except:
         return d
 
 def sign(v: float) -> str:
-    return f"+{v:,.2f}" if asf(v) > 0 else f"{asf(v):,.2f}"
+    x = asf(v)
+    return f"+{x:,.2f}" if x > 0 else f"{x:,.2f}"
 
 def pct(v: float) -> str:
-    return f"+{asf(v):.2f}%" if asf(v) > 0 else f"{asf(v):.2f}%"
+    x = asf(v)
+    return f"+{x:.2f}%" if x > 0 else f"{x:.2f}%"
 
 def fmt_num(v: float, d: int = 2) -> str:
     return f"{asf(v):,.{d}f}"
 
 def fmt_price(v: float) -> str:
-    x = abs(asf(v))
-    d = 2 if x >= 100 else (4 if x >= 1 else 6)
-    return f"{asf(v):,.{d}f}"
+    x = asf(v)
+    a = abs(x)
+    d = 2 if a >= 100 else (4 if a >= 1 else 6)
+    return f"{x:,.{d}f}"
 
 def fmt_qty(v: float) -> str:
     x = abs(asf(v))
     d = 2 if x >= 100 else 4
     return f"{x:,.{d}f}"
 
+@lru_cache(maxsize=512)  # 심볼 종류가 적어 포지션/템플릿 렌더마다 재계산 불필요
 def base_asset(symbol: str) -> str:
     s = (symbol or "").upper()
     for sep in ["-", "/", "_"]:
@@ -137,10 +208,19 @@ def base_asset(symbol: str) -> str:
 
 
 # ===== Upstash =====
+# 요청(webhook) 1건 안에서 같은 key GET 중복 왕복 제거용 캐시 (요청 밖에서는 미사용)
+@app.before_request
+def _r_cache_reset():
+    g._r_cache = {}
+
+def _rcache() -> Optional[Dict[str, Optional[str]]]:
+    return g.get("_r_cache") if has_app_context() else None
+
 class Redis:
-    def __init__(self, url: str, token: str):
+    def __init__(self, url: str, token: str, http: Optional[requests.Session] = None):
         self.url = (url or "").rstrip("/")
         self.token = token or ""
+        self.http = http or http_session({"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"})
 
     @property
     def ok(self):
@@ -150,100 +230,208 @@ class Redis:
         if not self.ok:
             return None
         try:
-            r = requests.post(
+            r = self.http.post(
                 self.url,
-                headers={"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"},
-                data=sjson(arr).encode("utf-8"),
+                data=sjsonb(arr),
                 timeout=TIMEOUT,
             )
             if r.status_code >= 400:
                 logging.warning("Upstash %s %s", r.status_code, r.text[:200])
+                self._track(arr, None)
                 return None
-            return r.json().get("result")
+            v = orjson.loads(r.content).get("result")
+            self._track(arr, v)
+            return v
         except Exception as e:
             logging.warning("Upstash error: %s", e)
+            self._track(arr, None)
             return None
 
+    def _track(self, arr: List[Any], res: Any):
+        """
+        요청 캐시 갱신: GET 결과 저장 / SET 성공 시 값 반영 / 그 외 쓰기는 key 무효화
+        """
+        c = _rcache()
+        if c is None or len(arr) < 2:
+            return
+        op = str(arr[0]).upper()
+        if op == "GET":
+            c[arr[1]] = None if res is None else str(res)
+        elif op == "SET" and len(arr) == 3 and res == "OK":
+            c[arr[1]] = str(arr[2])
+        elif op == "MGET" and isinstance(res, list):
+            for k, v in zip(arr[1:], res):
+                c[k] = None if v is None else str(v)
+        elif op == "DEL":
+            for k in arr[1:]:
+                c.pop(k, None)
+        else:
+            c.pop(arr[1], None)
+
+    def pipeline(self, arrs: List[List[Any]]) -> List[Any]:
+        """
+        여러 명령을 /pipeline 으로 1회 왕복 처리 (결과는 명령 순서대로, 실패 항목은 None)
+        """
+        if not arrs:
+            return []
+        if not self.ok:
+            return [None] * len(arrs)
+        try:
+            r = self.http.post(
+                self.url + "/pipeline",
+                data=sjsonb(arrs),
+                timeout=TIMEOUT,
+            )
+            if r.status_code >= 400:
+                logging.warning("Upstash pipeline %s %s", r.status_code, r.text[:200])
+                return [None] * len(arrs)
+            out: List[Any] = []
+            for x in orjson.loads(r.content):
+                if isinstance(x, dict) and x.get("error"):
+                    logging.warning("Upstash pipeline item error: %s", x.get("error"))
+                out.append(x.get("result") if isinstance(x, dict) else None)
+            out = (out + [None] * len(arrs))[: len(arrs)]
+        except Exception as e:
+            logging.warning("Upstash pipeline error: %s", e)
+            out = [None] * len(arrs)
+        for arr, v in zip(arrs, out):
+            self._track(arr, v)
+        return out
+
     def get(self, k: str):
+        c = _rcache()
+        if c is not None and k in c:
+            return c[k]
         v = self.cmd(["GET", k])
         return None if v is None else str(v)
 
+    def mget(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        v = self.cmd(["MGET", *keys])
+        if not isinstance(v, list):
+            return [None] * len(keys)
+        return [None if x is None else str(x) for x in v]
+
     def set(self, k: str, v: str):
         return self.cmd(["SET", k, v]) == "OK"
 
-    def delete(self, k: str):
-        return asi(self.cmd(["DEL", k])) >= 0
+    def hgetall(self, k: str) -> Optional[Dict[str, str]]:
+        """
+        HGETALL -> dict (key 없으면 {}, 오류/WRONGTYPE 이면 None)
+        """
+        v = self.cmd(["HGETALL", k])
+        if isinstance(v, dict):
+            return {str(a): str(b) for a, b in v.items()}
+        if not isinstance(v, list):
+            return None
+        return {str(v[i]): str(v[i + 1]) for i in range(0, len(v) - 1, 2)}
 
-    def lpush(self, k: str, v: str):
-        return asi(self.cmd(["LPUSH", k, v]))
+    def hset(self, k: str, f: str, v: str):
+        return self.cmd(["HSET", k, f, v]) is not None
 
-    def ltrim(self, k: str, a: int, b: int):
-        return self.cmd(["LTRIM", k, a, b]) == "OK"
+    def delete(self, k: str):
+        return asi(self.cmd(["DEL", k])) >= 0
 
     def lrange(self, k: str, a: int, b: int):
         v = self.cmd(["LRANGE", k, a, b])
         return [str(x) for x in v] if isinstance(v, list) else []
 
 
-R = Redis(UPSTASH_URL, UPSTASH_TOKEN)
+R = Redis(UPSTASH_URL, UPSTASH_TOKEN, _UPSTASH_SESSION)
+# fire-and-forget Redis 쓰기 전용 풀 (Telegram fan-out 풀 뒤에서 대기하지 않도록 분리)
+_REDIS_EXEC = ThreadPoolExecutor(max_workers=2, thread_name_prefix="redis")
 
 def rget_json(k: str, d):
     return pjson(R.get(k), d)
 
-def rset_json(k: str, v):
-    R.set(k, sjson(v))
+def rpush_json_cmd(k: str, v: Dict[str, Any], keep=2000) -> List[List[Any]]:
+    return [["LPUSH", k, sjson(v)], ["LTRIM", k, 0, keep - 1]]
 
 def rpush_json(k: str, v: Dict[str, Any], keep=2000):
-    R.lpush(k, sjson(v))
-    R.ltrim(k, 0, keep - 1)
+    # LPUSH + LTRIM 을 pipeline 1회 왕복으로
+    R.pipeline(rpush_json_cmd(k, v, keep))
+
+# ===== Lease =====
+# 프로세스 LOCK 을 I/O 동안 잡는 대신 Redis SET NX EX 로 워커 간 단일 실행 보장
+_LEASE_RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+def lease_acquire(name: str, ttl: int = 120) -> Optional[str]:
+    """
+    획득 시 token 리턴, 이미 다른 곳에서 실행 중이면 None
+    """
+    token = f"{os.getpid()}:{threading.get_ident()}:{time.time_ns()}"
+    if not R.ok:
+        return token if LOCK.acquire(blocking=False) else None
+    return token if R.cmd(["SET", f"lease:{name}", token, "NX", "EX", ttl]) == "OK" else None
+
+def lease_release(name: str, token: str):
+    if not R.ok:
+        LOCK.release()
+        return
+    # 본인 token 일 때만 삭제 (TTL 만료 후 다른 곳이 잡은 lease 보호)
+    R.cmd(["EVAL", _LEASE_RELEASE, 1, f"lease:{name}", token])
 
 
 # ===== Telegram =====
+_TG_API = "https://api.telegram.org/bot{token}/sendMessage"
+
+# ✅ 발송 슬롯 예약: bot(token) 단위 1/TG_RATE_PER_SEC 간격 + 같은 chat 은 TG_CHAT_GAP_MS 간격
+_TG_RATE_LOCK = threading.Lock()
+_TG_NEXT: Dict[str, float] = {}
+_TG_CHAT_NEXT: Dict[Tuple[str, str], float] = {}
+
+def _tg_throttle(token: str, chat_id: Any, chat_gap: bool = True):
+    """
+    token 슬롯은 chat 대기와 무관하게 예약 (한 chat 의 간격 대기가 다른 chat 발송을 밀지 않도록)
+    chat_gap=False: 직전 시도가 거절(미전달)된 재시도 -> chat 간격 생략
+    """
+    iv = 1.0 / max(TG_RATE_PER_SEC, 1)
+    ck = (token, str(chat_id))
+    with _TG_RATE_LOCK:
+        now = time.monotonic()
+        slot = max(now, _TG_NEXT.get(token, 0.0))
+        _TG_NEXT[token] = slot + iv
+        t = max(slot, _TG_CHAT_NEXT.get(ck, 0.0)) if chat_gap else slot
+        _TG_CHAT_NEXT[ck] = t + TG_CHAT_GAP_MS / 1000.0
+        if len(_TG_CHAT_NEXT) > 1024:
+            for x in [x for x, v in _TG_CHAT_NEXT.items() if v <= now]:
+                _TG_CHAT_NEXT.pop(x, None)
+    if t > now:
+        time.sleep(t - now)
+
+def _tg_post(token: str, body: Dict[str, Any], tag: str, chat_gap: bool = True) -> int:
+    """
+    sendMessage 1회 (공용 keep-alive 세션, 발송 한도 슬롯 대기 후)
+    -> 200 = 성공 / 4xx·5xx = Telegram 응답 코드 / 0 = 네트워크 오류·ok=false
+    """
+    _tg_throttle(token, body.get("chat_id"), chat_gap)
+    try:
+        r = _TG_SESSION.post(_TG_API.format(token=token), data=sjsonb(body), timeout=TIMEOUT)
+        if r.status_code >= 400:
+            logging.warning("TG send fail %s %s %s", tag, r.status_code, r.text[:300])
+            return r.status_code
+        j = orjson.loads(r.content)
+        if not j.get("ok"):
+            logging.warning("TG send fail %s json=%s", tag, j)
+            return 0
+        return 200
+    except Exception as e:
+        logging.warning("TG send err %s %s", tag, e)
+        return 0
+
 def tg_send(token: str, chat_id: str, text: str, preview=True) -> bool:
     if not token or not chat_id:
         return False
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+    body = {"chat_id": chat_id, "text": text, "disable_web_page_preview": preview}
 
     # 1) Markdown 시도
-    try:
-        r = requests.post(
-            url,
-            json={
-                "chat_id": chat_id,
-                "text": text,
-                "parse_mode": "Markdown",
-                "disable_web_page_preview": preview,
-            },
-            timeout=TIMEOUT,
-        )
-        if r.status_code < 400:
-            j = r.json()
-            if j.get("ok"):
-                return True
-            logging.warning("TG send fail markdown json=%s", j)
-        else:
-            logging.warning("TG send fail markdown %s %s", r.status_code, r.text[:300])
-    except Exception as e:
-        logging.warning("TG send err markdown %s", e)
-
-    # 2) Markdown 파싱 에러 대비 plain-text 재시도
-    try:
-        r2 = requests.post(
-            url,
-            json={"chat_id": chat_id, "text": text, "disable_web_page_preview": preview},
-            timeout=TIMEOUT,
-        )
-        if r2.status_code >= 400:
-            logging.warning("TG send fail plain %s %s", r2.status_code, r2.text[:300])
-            return False
-        j2 = r2.json()
-        if not j2.get("ok"):
-            logging.warning("TG send fail plain json=%s", j2)
-            return False
+    st = _tg_post(token, {**body, "parse_mode": "Markdown"}, "markdown")
+    if st == 200:
         return True
-    except Exception as e:
-        logging.warning("TG send err plain %s", e)
-        return False
+
+    # 2) Markdown 파싱 에러 대비 plain-text 재시도 (400 거절분은 전달되지 않았으므로 chat 간격 생략)
+    return _tg_post(token, body, "plain", chat_gap=st != 400) == 200
 
 def tg_send_plain(token: str, chat_id: str, text: str, preview=True) -> bool:
     """
@@ -252,40 +440,47 @@ def tg_send_plain(token: str, chat_id: str, text: str, preview=True) -> bool:
     """
     if not token or not chat_id:
         return False
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    try:
-        r = requests.post(
-            url,
-            json={"chat_id": chat_id, "text": text, "disable_web_page_preview": preview},
-            timeout=TIMEOUT,
-        )
-        if r.status_code >= 400:
-            logging.warning("TG send plain-only fail %s %s", r.status_code, r.text[:300])
-            return False
-        j = r.json()
-        if not j.get("ok"):
-            logging.warning("TG send plain-only fail json=%s", j)
-            return False
-        return True
-    except Exception as e:
-        logging.warning("TG send plain-only err %s", e)
-        return False
+    return _tg_post(token, {"chat_id": chat_id, "text": text, "disable_web_page_preview": preview}, "plain-only") == 200
+
+# 다수 chat 발송은 풀에서 병렬 처리 (N * RTT -> 1 * RTT)
+_EXEC = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tg")
+
+def tg_send_async(token: str, chat_id: str, text: str, preview=True, plain=False) -> Future:
+    return _EXEC.submit(tg_send_plain if plain else tg_send, token, chat_id, text, preview)
+
+def tg_wait(futs: List[Future]) -> int:
+    """
+    fan-out 발송 결과 대기 (최대 TG_FANOUT_WAIT초) 후 성공 건수 리턴
+    """
+    done, _ = wait(futs, timeout=TG_FANOUT_WAIT)
+    return sum(1 for f in done if not f.exception() and f.result())
+
+def tg_send_bulk(token: str, chat_ids: List[str], text: str, plain=False) -> int:
+    """
+    여러 chat 에 동시 발송 -> RTT 는 겹치고, 초당 발송량/chat 간격은 _tg_throttle 이 제한
+    """
+    return tg_wait([tg_send_async(token, cid, text, plain=plain) for cid in chat_ids])
 
 def tg_send_chunk(token: str, chat_id: str, text: str, n=3500):
     if len(text) <= n:
         tg_send(token, chat_id, text)
         return
-    cur = ""
+    # list 버퍼 + 길이 누적 (문자열 += 반복 복사 방지)
+    buf: List[str] = []
+    size = 0
     for ln in text.splitlines():
-        add = ln + "\n"
-        if len(cur) + len(add) > n:
+        L = len(ln) + 1  # join 시 붙는 "\n"
+        if size + L > n:
+            cur = "\n".join(buf).rstrip()
             if cur.strip():
-                tg_send(token, chat_id, cur.rstrip())
-            cur = add
+                tg_send(token, chat_id, cur)
+            buf, size = [ln], L
         else:
-            cur += add
+            buf.append(ln)
+            size += L
+    cur = "\n".join(buf).rstrip()
     if cur.strip():
-        tg_send(token, chat_id, cur.rstrip())
+        tg_send(token, chat_id, cur)
 
 
 # ===== Switch/Config =====
@@ -299,15 +494,57 @@ def is_admin(uid: str) -> bool:
     return (not ADMIN_USER_IDS) or (str(uid) in ADMIN_USER_IDS)
 
 def sw_key(kind: str, chat_id: str) -> str:
+    # 구버전(chat 별 개별 key) - bootstrap 이전용
     return f"switch:{kind}:{chat_id}"
 
-def sw_get(kind: str, chat_id: str) -> str:
-    d = "0" if is_group(chat_id) else "1"
-    v = R.get(sw_key(kind, chat_id))
-    return "1" if (v if v is not None else d) == "1" else "0"
+def sw_hkey(kind: str) -> str:
+    return f"switch:{kind}"
+
+# ✅ kind 별 스위치 hash 를 HGETALL 1회로 읽고 짧게 캐시 (알림마다 Redis 왕복 방지)
+_SW_TTL = 2.0
+_SW_CACHE: Dict[str, Tuple[float, Dict[str, str]]] = {}
+
+def sw_all(kind: str) -> Dict[str, str]:
+    hit = _SW_CACHE.get(kind)
+    if hit and time.monotonic() - hit[0] < _SW_TTL:
+        return hit[1]
+    h = R.hgetall(sw_hkey(kind))
+    if h is None:
+        return hit[1] if hit else {}
+    _SW_CACHE[kind] = (time.monotonic(), h)
+    return h
+
+def sw_many(kind: str, chat_ids: List[str]) -> Dict[str, str]:
+    """
+    여러 chat 스위치를 한 번에 조회 -> "1"/"0" (hash 에 없으면 그룹 OFF, 개인 ON)
+    """
+    h = sw_all(kind)
+    out: Dict[str, str] = {}
+    for c in chat_ids:
+        v = h.get(c)
+        d = "0" if is_group(c) else "1"
+        out[c] = "1" if (v if v is not None else d) == "1" else "0"
+    return out
+
+# chat 목록은 ENV 고정이므로 그룹/개인 분리는 기동 시 1회만
+_GROUP_IDS = {
+    "signal": tuple(c for c in CHAT_IDS if is_group(c)),
+    "position": tuple(c for c in CHAT_IDS_POSITION if is_group(c)),
+}
+_PRIVATE_IDS = {
+    "signal": tuple(c for c in CHAT_IDS if not is_group(c)),
+    "position": tuple(c for c in CHAT_IDS_POSITION if not is_group(c)),
+}
+
+def alert_targets(kind: str) -> List[str]:
+    # 개인 chat 은 항상 발송, 그룹은 스위치 ON 일 때만
+    gs = _GROUP_IDS[kind]
+    sw = sw_many(kind, list(gs))
+    return [*_PRIVATE_IDS[kind], *(c for c in gs if sw[c] == "1")]
 
 def sw_set(kind: str, chat_id: str, on: bool):
-    R.set(sw_key(kind, chat_id), "1" if on else "0")
+    R.hset(sw_hkey(kind), chat_id, "1" if on else "0")
+    _SW_CACHE.pop(kind, None)
 
 def cfg_get(k: str, d=""):
     v = R.get(f"cfg:{k}")
@@ -315,50 +552,63 @@ def cfg_get(k: str, d=""):
 
 def cfg_set(k: str, v: str):
     R.set(f"cfg:{k}", str(v))
+    if k in _AUTO_CFG_KEYS:
+        _auto_cfg["t"] = None
 
 def cfg_init():
-    if cfg_get("report_auto", "") == "":
-        cfg_set("report_auto", "on" if REPORT_AUTO_DEFAULT == "on" else "off")
-
-    if cfg_get("report_auto_hour", "") == "":
-        cfg_set("report_auto_hour", str(REPORT_AUTO_HOUR_DEFAULT))
-
-    if cfg_get("report_auto_minute", "") == "":
-        cfg_set("report_auto_minute", str(REPORT_AUTO_MINUTE_DEFAULT))
-
-    if cfg_get("report_auto_chat", "") == "":
-        target = REPORT_AUTO_CHAT_DEFAULT
-        if not target:
-            cands = [c for c in CHAT_IDS_POSITION if not is_group(c)]
-            target = cands[0] if cands else (CHAT_IDS_POSITION[0] if CHAT_IDS_POSITION else (CHAT_IDS[0] if CHAT_IDS else ""))
-        cfg_set("report_auto_chat", target)
+    # GET 4건 / 누락분 SET 을 각각 pipeline 1회로 처리
+    target = REPORT_AUTO_CHAT_DEFAULT
+    if not target:
+        cands = _PRIVATE_IDS["position"]
+        target = cands[0] if cands else (CHAT_IDS_POSITION[0] if CHAT_IDS_POSITION else (CHAT_IDS[0] if CHAT_IDS else ""))
+    defaults = {
+        "report_auto": "on" if REPORT_AUTO_DEFAULT == "on" else "off",
+        "report_auto_hour": str(REPORT_AUTO_HOUR_DEFAULT),
+        "report_auto_minute": str(REPORT_AUTO_MINUTE_DEFAULT),
+        "report_auto_chat": target,
+    }
+    vals = R.pipeline([["GET", f"cfg:{k}"] for k in defaults])
+    R.pipeline([["SET", f"cfg:{k}", d] for (k, d), v in zip(defaults.items(), vals) if v is None or str(v) == ""])
 
 def switch_log(cmd: str, uid: str, note: str = ""):
     rpush_json("logs:switch", {"ts": now_kst().isoformat(), "cmd": cmd, "uid": uid, "note": note}, keep=300)
 
 
 # ===== BingX =====
-def bingx_req(path: str, params: Optional[Dict[str, Any]] = None, method="GET") -> Optional[Dict[str, Any]]:
-    if not (BINGX_API_KEY and BINGX_API_SECRET):
-        return None
+# 이 모듈에서 쓰는 파라미터 전체 (이미 정렬된 순서). 그 외 key 가 섞이면 sorted 경로
+_BINGX_KEY_ORDER = ("endTime", "limit", "recvWindow", "startTime", "symbol", "timestamp")
+_BINGX_KEYS = frozenset(_BINGX_KEY_ORDER)
 
+def bingx_sign(params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    timestamp/recvWindow 추가 후 정렬 querystring + HMAC-SHA256 signature
+    """
     p = dict(params or {})
     p["timestamp"] = int(time.time() * 1000)
     p["recvWindow"] = 5000
-    qs = urlencode(sorted(p.items(), key=lambda x: x[0]), doseq=True)
+    if p.keys() <= _BINGX_KEYS:
+        qs = "&".join(f"{k}={quote_plus(str(p[k]))}" for k in _BINGX_KEY_ORDER if k in p)
+    else:
+        qs = urlencode(sorted(p.items(), key=lambda x: x[0]), doseq=True)
     sig = hmac.new(BINGX_API_SECRET.encode(), qs.encode(), hashlib.sha256).hexdigest()
-    url = f"{BINGX_BASE_URL}{path}?{qs}&signature={sig}"
+    return f"{qs}&signature={sig}"
+
+def bingx_req(path: str, params: Optional[Dict[str, Any]] = None, method="GET") -> Optional[Dict[str, Any]]:
+    if not (BINGX_API_KEY and BINGX_API_SECRET):
+        return None
+
+    url = f"{BINGX_BASE_URL}{path}?{bingx_sign(params)}"
 
     try:
         r = (
-            requests.post(url, headers={"X-BX-APIKEY": BINGX_API_KEY}, timeout=TIMEOUT)
+            _BINGX_SESSION.post(url, timeout=TIMEOUT)
             if method == "POST"
-            else requests.get(url, headers={"X-BX-APIKEY": BINGX_API_KEY}, timeout=TIMEOUT)
+            else _BINGX_SESSION.get(url, timeout=TIMEOUT)
         )
         if r.status_code >= 400:
             logging.warning("BingX %s %s %s", r.status_code, path, r.text[:240])
             return None
-        return r.json()
+        return orjson.loads(r.content)
     except Exception as e:
         logging.warning("BingX err %s %s", path, e)
         return None
@@ -375,37 +625,64 @@ def data_list(x: Any) -> List[Dict[str, Any]]:
             return [x]
     return []
 
-def fetch_positions_raw() -> List[Dict[str, Any]]:
-    eps = [
-        "/openApi/swap/v2/user/positions",
-        "/openApi/swap/v2/user/position",
-        "/openApi/swap/v1/user/positions",
-        "/openApi/swap/v1/user/position",
-    ]
+# 후보 endpoint 중 응답이 확인된 것 (name -> path). 이후 호출은 이것만 먼저 사용
+_BINGX_OK_EP: Dict[str, str] = {}
+
+def bingx_probe(name: str, eps: List[str], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    ok = _BINGX_OK_EP.get(name)
+    if ok:
+        j = bingx_req(ok, params)
+        # 확인된 endpoint 가 정상(code 0) 응답이면 빈 목록도 그대로 신뢰 (나머지 후보 재탐색 안함)
+        if j and str(j.get("code", 0)) == "0":
+            return data_list(j.get("data", j))
     for ep in eps:
-        j = bingx_req(ep, {})
+        if ep == ok:
+            continue
+        j = bingx_req(ep, params)
         if not j:
             continue
         arr = data_list(j.get("data", j))
         if arr:
+            _BINGX_OK_EP[name] = ep
             return arr
     return []
 
+def fetch_positions_raw() -> List[Dict[str, Any]]:
+    eps = [
+        "/openApi/swap/v2/user/positions",
+        "/openApi/swap/v2/user/position",
+        "/openApi/swap/v1/user/positions",
+        "/openApi/swap/v1/user/position",
+    ]
+    return bingx_probe("positions", eps, {})
+
+# norm_pos 필드별 후보 key (앞쪽 우선, 기존 `or` 체인과 동일하게 falsy 값은 건너뜀)
+_SYMBOL_KEYS = ("symbol", "ticker", "pair")
+_QTY_KEYS = ("positionAmt", "positionSize", "position", "positionAmount", "holdVolume", "size")
+_SIDE_KEYS = ("positionSide", "side", "holdSide", "posSide")
+_ENTRY_KEYS = ("avgPrice", "entryPrice", "avgOpenPrice", "openPrice")
+_MARK_KEYS = ("markPrice", "lastPrice", "indexPrice", "closePrice")
+_UPL_KEYS = ("unrealizedProfit", "unRealizedProfit", "unrealizedPnl", "upl", "positionProfit")
+_RPL_KEYS = ("realizedProfit", "realisedPnl", "realizedPnl", "rpl")
+_LEV_KEYS = ("leverage", "positionLeverage")
+_MM_KEYS = ("marginType", "marginMode", "isolated")
+_VALUE_KEYS = ("positionValue", "notional", "positionNotional", "value")
+_MARGIN_KEYS = ("positionMargin", "isolatedMargin", "margin")
+
+def _first(it: Dict[str, Any], keys: Tuple[str, ...], default: Any = None) -> Any:
+    for k in keys:
+        v = it.get(k)
+        if v:
+            return v
+    return default
+
 def norm_pos(it: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    symbol = str(it.get("symbol") or it.get("ticker") or it.get("pair") or "").strip()
+    symbol = str(_first(it, _SYMBOL_KEYS, "")).strip()
     if not symbol:
         return None
 
-    qty_signed = asf(
-        it.get("positionAmt")
-        or it.get("positionSize")
-        or it.get("position")
-        or it.get("positionAmount")
-        or it.get("holdVolume")
-        or it.get("size")
-        or 0
-    )
-    sraw = str(it.get("positionSide") or it.get("side") or it.get("holdSide") or it.get("posSide") or "").lower()
+    qty_signed = asf(_first(it, _QTY_KEYS, 0))
+    sraw = str(_first(it, _SIDE_KEYS, "")).lower()
 
     if "short" in sraw or sraw in ("sell", "2"):
         side = "Short"
@@ -420,17 +697,19 @@ def norm_pos(it: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     if qty <= 0:
         return None
 
-    entry = asf(it.get("avgPrice") or it.get("entryPrice") or it.get("avgOpenPrice") or it.get("openPrice") or 0)
-    mark = asf(it.get("markPrice") or it.get("lastPrice") or it.get("indexPrice") or it.get("closePrice") or entry, entry)
-    upl = asf(it.get("unrealizedProfit") or it.get("unRealizedProfit") or it.get("unrealizedPnl") or it.get("upl") or it.get("positionProfit") or 0)
-    rpl = asf(it.get("realizedProfit") or it.get("realisedPnl") or it.get("realizedPnl") or it.get("rpl") or 0)
-    lev = asf(it.get("leverage") or it.get("positionLeverage") or 0, 0.0)
+    entry = asf(_first(it, _ENTRY_KEYS, 0))
+    mark = asf(_first(it, _MARK_KEYS, entry), entry)
+    upl = asf(_first(it, _UPL_KEYS, 0))
+    rpl = asf(_first(it, _RPL_KEYS, 0))
+    lev = asf(_first(it, _LEV_KEYS, 0), 0.0)
 
-    mm = str(it.get("marginType") or it.get("marginMode") or it.get("isolated") or "")
+    mm = str(_first(it, _MM_KEYS, ""))
     margin_mode = "Isolated" if ("isol" in mm.lower() or mm in ("true", "1")) else "Cross"
 
-    value = asf(it.get("positionValue") or it.get("notional") or it.get("positionNotional") or it.get("value") or qty * mark, qty * mark)
-    margin = asf(it.get("positionMargin") or it.get("isolatedMargin") or it.get("margin") or (value / lev if lev > 0 else 0), (value / lev if lev > 0 else 0))
+    qm = qty * mark
+    value = asf(_first(it, _VALUE_KEYS, qm), qm)
+    vl = (value / lev) if lev > 0 else 0
+    margin = asf(_first(it, _MARGIN_KEYS, vl), vl)
     if lev <= 0:
         lev = (value / margin) if margin > 0 else 1.0
 
@@ -461,86 +740,125 @@ def fetch_positions() -> List[Dict[str, Any]]:
             out.append(n)
     return out
 
+# /pos_snapshot 과 포지션 체크가 붙어서 호출될 때 거래소 중복 조회 방지 (2초)
+_POS_CACHE_TTL = 2.0
+_pos_cache: Dict[str, Any] = {"t": None, "v": []}
+
+def fetch_positions_cached() -> List[Dict[str, Any]]:
+    t = _pos_cache["t"]
+    if t is not None and time.monotonic() - t < _POS_CACHE_TTL:
+        return list(_pos_cache["v"])
+    v = fetch_positions()
+    _pos_cache.update(t=time.monotonic(), v=v)
+    return list(v)
+
+def fetch_positions_cache_clear():
+    _pos_cache["t"] = None
+
 def fetch_income(symbol: str, start_ms: int, end_ms: int) -> List[Dict[str, Any]]:
     eps = ["/openApi/swap/v2/user/income", "/openApi/swap/v1/user/income", "/openApi/swap/v2/user/income/list"]
     p = {"symbol": symbol, "startTime": start_ms, "endTime": end_ms, "limit": 200}
-    for ep in eps:
-        j = bingx_req(ep, p)
-        if not j:
-            continue
-        arr = data_list(j.get("data", j))
-        if arr:
-            return arr
-    return []
+    return bingx_probe("income", eps, p)
 
 
 # ===== Template Lock =====
-def tpl_open(p: Dict[str, Any]) -> str:
-    head = "📈 *포지션 오픈*" if p["side"] == "Long" else "📉 *포지션 오픈*"
-    return (
-        f"{head}\n"
-        f"━━━━━━━━━━━━━━\n"
-        f"BingX · {p['symbol']}\n"
-        f"{p['side']} · {p['margin_mode']} · {int(round(p['leverage']))}x\n\n"
-        f"*Entry*    : *{fmt_price(p['entry_price'])} USDT*\n"
-        f"*Position* : *{fmt_qty(p['qty'])} {p['base']}*\n"
-        f"Value      : {fmt_num(p['value'],2)} USDT\n"
-        f"Margin     : {fmt_num(p['margin'],2)} USDT\n\n"
-        f"uPnL : {sign(p['u_pnl'])} USDT ({pct(p['u_pnl_pct'])})\n"
-        f"rPnL : {sign(p['r_pnl'])} USDT\n\n"
-        f"🕒 {to_kst()}"
+# 고정 문구는 모듈 상수, 가변 값만 렌더마다 1회 포맷 후 format_map
+_TPL_HEAD = (
+    "{head}\n"
+    "━━━━━━━━━━━━━━\n"
+    "BingX · {symbol}\n"
+    "{side} · {margin_mode} · {lev}x\n\n"
+)
+_TPL_PNL = (
+    "uPnL : {u_pnl} USDT ({u_pnl_pct})\n"
+    "rPnL : {r_pnl} USDT\n\n"
+    "🕒 {now}"
+)
+_TPL_OPEN = _TPL_HEAD + (
+    "*Entry*    : *{entry} USDT*\n"
+    "*Position* : *{qty} {base}*\n"
+    "Value      : {value} USDT\n"
+    "Margin     : {margin} USDT\n\n"
+) + _TPL_PNL
+_TPL_CHANGE = _TPL_HEAD + (
+    "*Entry*  : *{entry0}  →  {entry} USDT*\n"
+    "Position : {qty0} {base}  →  {qty} {base}\n"
+    "Value    : {value0}      →  {value} USDT\n"
+    "Margin   : {margin0}       →  {margin} USDT\n\n"
+) + _TPL_PNL
+_TPL_CLOSE = _TPL_HEAD + (
+    "기간       : {period}\n"
+    "진입가     : {entry} USDT\n"
+    "종료가     : {close} USDT\n\n"
+    "총 진입금액 : {entry_value} USDT\n"
+    "총 종료금액 : {exit_value} USDT\n\n"
+    "Closed PnL : {closed} USDT\n"
+    "Fee+Funding: {fee} USDT\n"
+    "*Realized   : {realized} USDT*\n\n"
+    "🕒 {now}"
+)
+
+def _tpl_pos_vals(head: str, p: Dict[str, Any], r_pnl_override: Optional[float] = None) -> Dict[str, Any]:
+    return {
+        "head": head,
+        "symbol": p["symbol"],
+        "side": p["side"],
+        "margin_mode": p["margin_mode"],
+        "lev": int(round(p["leverage"])),
+        "entry": fmt_price(p["entry_price"]),
+        "qty": fmt_qty(p["qty"]),
+        "base": p["base"],
+        "value": fmt_num(p["value"], 2),
+        "margin": fmt_num(p["margin"], 2),
+        "u_pnl": sign(p["u_pnl"]),
+        "u_pnl_pct": pct(p["u_pnl_pct"]),
+        "r_pnl": sign(p["r_pnl"] if r_pnl_override is None else r_pnl_override),
+        "now": to_kst(),
+    }
+
+def _tpl_change(head: str, prev: Dict[str, Any], cur: Dict[str, Any], r_pnl_override: Optional[float] = None) -> str:
+    d = _tpl_pos_vals(head, cur, r_pnl_override)
+    d.update(
+        entry0=fmt_price(prev["entry_price"]),
+        qty0=fmt_qty(prev["qty"]),
+        value0=fmt_num(prev["value"], 2),
+        margin0=fmt_num(prev["margin"], 2),
     )
+    return _TPL_CHANGE.format_map(d)
+
+# r_pnl_override: 표시용 rPnL (None 이면 p["r_pnl"])
+def tpl_open(p: Dict[str, Any], r_pnl_override: Optional[float] = None) -> str:
+    head = "📈 *포지션 오픈*" if p["side"] == "Long" else "📉 *포지션 오픈*"
+    return _TPL_OPEN.format_map(_tpl_pos_vals(head, p, r_pnl_override))
 
 # ✅ 요청 포맷 반영 (Entry 윗줄 유지)
-def tpl_add(prev: Dict[str, Any], cur: Dict[str, Any]) -> str:
-    return (
-        f"➕ *포지션 추가 진입*\n"
-        f"━━━━━━━━━━━━━━\n"
-        f"BingX · {cur['symbol']}\n"
-        f"{cur['side']} · {cur['margin_mode']} · {int(round(cur['leverage']))}x\n\n"
-        f"*Entry*  : *{fmt_price(prev['entry_price'])}  →  {fmt_price(cur['entry_price'])} USDT*\n"
-        f"Position : {fmt_qty(prev['qty'])} {cur['base']}  →  {fmt_qty(cur['qty'])} {cur['base']}\n"
-        f"Value    : {fmt_num(prev['value'],2)}      →  {fmt_num(cur['value'],2)} USDT\n"
-        f"Margin   : {fmt_num(prev['margin'],2)}       →  {fmt_num(cur['margin'],2)} USDT\n\n"
-        f"uPnL : {sign(cur['u_pnl'])} USDT ({pct(cur['u_pnl_pct'])})\n"
-        f"rPnL : {sign(cur['r_pnl'])} USDT\n\n"
-        f"🕒 {to_kst()}"
-    )
+def tpl_add(prev: Dict[str, Any], cur: Dict[str, Any], r_pnl_override: Optional[float] = None) -> str:
+    return _tpl_change("➕ *포지션 추가 진입*", prev, cur, r_pnl_override)
 
 # ✅ 포지션 감소 알림 추가 (같은 레이아웃)
-def tpl_reduce(prev: Dict[str, Any], cur: Dict[str, Any]) -> str:
-    return (
-        f"➖ *포지션 감소*\n"
-        f"━━━━━━━━━━━━━━\n"
-        f"BingX · {cur['symbol']}\n"
-        f"{cur['side']} · {cur['margin_mode']} · {int(round(cur['leverage']))}x\n\n"
-        f"*Entry*  : *{fmt_price(prev['entry_price'])}  →  {fmt_price(cur['entry_price'])} USDT*\n"
-        f"Position : {fmt_qty(prev['qty'])} {cur['base']}  →  {fmt_qty(cur['qty'])} {cur['base']}\n"
-        f"Value    : {fmt_num(prev['value'],2)}      →  {fmt_num(cur['value'],2)} USDT\n"
-        f"Margin   : {fmt_num(prev['margin'],2)}       →  {fmt_num(cur['margin'],2)} USDT\n\n"
-        f"uPnL : {sign(cur['u_pnl'])} USDT ({pct(cur['u_pnl_pct'])})\n"
-        f"rPnL : {sign(cur['r_pnl'])} USDT\n\n"
-        f"🕒 {to_kst()}"
-    )
+def tpl_reduce(prev: Dict[str, Any], cur: Dict[str, Any], r_pnl_override: Optional[float] = None) -> str:
+    return _tpl_change("➖ *포지션 감소*", prev, cur, r_pnl_override)
 
 def tpl_close(sess: Dict[str, Any], close_price: float, closed: float, fee: float, realized: float) -> str:
     st = iso_parse(sess.get("start_ts", "")) or now_kst()
     en = now_kst()
-    period = f"{st.astimezone(KST).strftime('%m-%d %H:%M')} ~ {en.astimezone(KST).strftime('%H:%M')} (KST)"
-    return (
-        f"✅ *포지션 종료*\n"
-        f"━━━━━━━━━━━━━━\n"
-        f"BingX · {sess['symbol']}\n"
-        f"{sess['side']} · {sess['margin_mode']} · {int(round(sess['leverage']))}x\n\n"
-        f"기간       : {period}\n"
-        f"진입가     : {fmt_price(sess['entry_price_init'])} USDT\n"
-        f"종료가     : {fmt_price(close_price)} USDT\n\n"
-        f"총 진입금액 : {fmt_num(sess['total_entry_value'],2)} USDT\n"
-        f"총 종료금액 : {fmt_num(sess['total_exit_value'],2)} USDT\n\n"
-        f"Closed PnL : {sign(closed)} USDT\n"
-        f"Fee+Funding: {sign(fee)} USDT\n"
-        f"*Realized   : {sign(realized)} USDT*\n\n"
-        f"🕒 {to_kst(en)}"
+    return _TPL_CLOSE.format_map(
+        {
+            "head": "✅ *포지션 종료*",
+            "symbol": sess["symbol"],
+            "side": sess["side"],
+            "margin_mode": sess["margin_mode"],
+            "lev": int(round(sess["leverage"])),
+            "period": f"{st.astimezone(KST).strftime('%m-%d %H:%M')} ~ {en.astimezone(KST).strftime('%H:%M')} (KST)",
+            "entry": fmt_price(sess["entry_price_init"]),
+            "close": fmt_price(close_price),
+            "entry_value": fmt_num(sess["total_entry_value"], 2),
+            "exit_value": fmt_num(sess["total_exit_value"], 2),
+            "closed": sign(closed),
+            "fee": sign(fee),
+            "realized": sign(realized),
+            "now": to_kst(en),
+        }
     )
 
 def tpl_barcode(side, symbol, price, tf, ts):
@@ -607,6 +925,22 @@ HELP_TEXT = (
 
 
 # ===== Signal Parse =====
+# 웹훅마다 타는 파싱 경로라 패턴은 모듈 로드시 1회 컴파일
+_LB = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"  # str.splitlines 줄 경계
+_RE_PAYLOAD_KV = re.compile(
+    rf"(?:^|(?<=[,{_LB}]))[^\S{_LB}]*([A-Za-z0-9_.\-]+)[^\S{_LB}]*[:=][^\S{_LB}]*([^,{_LB}]*[^\s,])"
+)
+_RE_NUM_TOKEN = re.compile(r"-?\d+(\.\d+)?")
+_RE_NON_DIGIT = re.compile(r"\D")
+_RE_SYMBOL = re.compile(r'([A-Z0-9]+[:·])?([A-Z]{2,20}(?:USDT|USD)(?:\.P|PERP)?)')
+_RE_TF = re.compile(r'\b(\d+\s*[mhdw])\b')
+_RE_TF_TOKEN = re.compile(r"\d+[mhdw]")
+_RE_DEC = re.compile(r'(?<!\d)(\d+\.\d+)(?!\d)')
+_RE_INT = re.compile(r'(?<!\d)(\d{3,})(?!\d)')
+_RE_ZONE_KO = re.compile(r"구간\s*(\d+)")
+_RE_ZONE_EN = re.compile(r"\bzone\s*(\d+)\b", re.IGNORECASE)
+_RE_RANGE = re.compile(r'(?<!\d)(\d+(?:\.\d+)?)[ ]*~[ ]*(\d+(?:\.\d+)?)(?!\d)')
+
 def _parse_plain_text_payload(raw: str) -> Dict[str, Any]:
     """
     TradingView가 text/plain으로 보내는 경우 대응
@@ -619,51 +953,41 @@ def _parse_plain_text_payload(raw: str) -> Dict[str, Any]:
     if not raw:
         return out
 
-    # 1) JSON 문자열
-    try:
-        j = json.loads(raw)
-        if isinstance(j, dict):
-            return j
-    except:
-        pass
-
-    # 2) querystring
-    if "=" in raw and "&" in raw and "\n" not in raw:
+    # 1) JSON 문자열 (dict 만 채택하므로 '{' 로 시작할 때만 시도 -> 일반 텍스트는 예외 비용 없음)
+    if raw[0] == "{":
         try:
-            qs = parse_qs(raw, keep_blank_values=True)
-            for k, v in qs.items():
-                if v:
-                    out[k] = v[-1]
-            if out:
-                out["text"] = raw
-                return out
-        except:
+            j = jloads(raw)
+            if isinstance(j, dict):
+                return j
+        except (ValueError, RecursionError):  # 깊은 중첩은 stdlib 재시도에서 RecursionError
             pass
 
-    # 3) line/csv key:value or key=value
-    lines: List[str] = []
-    for block in raw.splitlines():
-        block = block.strip()
-        if not block:
-            continue
-        parts = [p.strip() for p in block.split(",")] if (":" in block or "=" in block) else [block]
-        lines.extend([p for p in parts if p])
-
-    kv_pat = re.compile(r'^\s*([A-Za-z0-9_.\-]+)\s*[:=]\s*(.+?)\s*$')
-    for ln in lines:
-        m = kv_pat.match(ln)
-        if m:
-            k, v = m.group(1), m.group(2)
-            out[k] = v.strip().strip('"').strip("'")
+    # 2) querystring
+    if "=" in raw and "&" in raw and "\n" not in raw:
+        for pair in raw.split("&"):
+            k, _, v = pair.partition("=")
+            if k:
+                out[unquote_plus(k)] = unquote_plus(v)
+        if out:
+            out["text"] = raw
+            return out
+
+    # 3) line/csv key:value or key=value (줄 시작 또는 쉼표 직후의 key 만, 전체 1회 스캔)
+    for m in _RE_PAYLOAD_KV.finditer(raw):
+        out[m.group(1)] = m.group(2).strip().strip('"').strip("'")
 
     out["text"] = raw
     return out
 
 def parse_tv_payload(req) -> Dict[str, Any]:
     # JSON 우선
-    j = req.get_json(silent=True)
-    if isinstance(j, dict):
-        return j
+    if req.is_json:
+        try:
+            j = jloads(req.get_data(cache=True))
+        except (ValueError, RecursionError):
+            j = None
+        if isinstance(j, dict):
+            return j
 
     # form-data 대응
     try:
@@ -688,10 +1012,10 @@ def _is_num_token(v: Any) -> bool:
     if v is None:
         return False
     s = str(v).strip().replace(",", "")
-    return bool(re.fullmatch(r"-?\d+(\.\d+)?", s))
+    return bool(_RE_NUM_TOKEN.fullmatch(s))
 
 def _tf_num(tf: str) -> str:
-    return re.sub(r"\D", "", str(tf or ""))
+    return _RE_NON_DIGIT.sub("", str(tf or ""))
 
 def _looks_like_tf_multiplier(v: Any, tf: str) -> bool:
     s = str(v).strip()
@@ -700,14 +1024,14 @@ def _looks_like_tf_multiplier(v: Any, tf: str) -> bool:
 
 def _extract_symbol_from_text(raw_text: str) -> Optional[str]:
     t = (raw_text or "").upper()
-    m = re.search(r'([A-Z0-9]+[:·])?([A-Z]{2,20}(?:USDT|USD)(?:\.P|PERP)?)', t)
+    m = _RE_SYMBOL.search(t)
     if not m:
         return None
     return m.group(0)
 
 def _extract_tf_from_text(raw_text: str) -> Optional[str]:
     t = (raw_text or "").lower()
-    m = re.search(r'\b(\d+\s*[mhdw])\b', t)
+    m = _RE_TF.search(t)
     if m:
         return m.group(1).replace(" ", "")
     return None
@@ -724,16 +1048,17 @@ def _extract_price_from_text(raw_text: str, tf: str) -> str:
             mid = parts[1]
             right = parts[2].lower().replace(" ", "")
             if _is_num_token(mid):
-                if not (_looks_like_tf_multiplier(mid, tf) and re.fullmatch(r"\d+[mhdw]", right)):
+                if not (_looks_like_tf_multiplier(mid, tf) and _RE_TF_TOKEN.fullmatch(right)):
                     return mid
 
     # 2) 소수점 가격 우선
-    m_dec = re.search(r'(?<!\d)(\d+\.\d+)(?!\d)', t.replace(",", ""))
+    t = t.replace(",", "")
+    m_dec = _RE_DEC.search(t)
     if m_dec:
         return m_dec.group(1)
 
     # 3) 정수는 3자리 이상만 가격으로 인정
-    m_int = re.search(r'(?<!\d)(\d{3,})(?!\d)', t.replace(",", ""))
+    m_int = _RE_INT.search(t)
     if m_int:
         return m_int.group(1)
 
@@ -753,12 +1078,12 @@ def _extract_prism_zone(payload: Dict[str, Any], raw_text: str) -> str:
 
     # 2) text 기반: "구간6", "구간 6"
     t = (raw_text or "")
-    m = re.search(r"구간\s*(\d+)", t)
+    m = _RE_ZONE_KO.search(t)
     if m:
         return m.group(1)
 
     # 3) 영문도 혹시
-    m2 = re.search(r"\bzone\s*(\d+)\b", t, flags=re.IGNORECASE)
+    m2 = _RE_ZONE_EN.search(t)
     if m2:
         return m2.group(1)
 
@@ -767,11 +1092,40 @@ def _extract_prism_zone(payload: Dict[str, Any], raw_text: str) -> str:
 # ✅ (추가) Prism 레인지 텍스트 파싱: "65777.8 ~ 65811.9"
 def _extract_range_from_text(raw_text: str) -> Tuple[str, str]:
     t = (raw_text or "").replace(",", "")
-    m = re.search(r'(?<!\d)(\d+(?:\.\d+)?)[ ]*~[ ]*(\d+(?:\.\d+)?)(?!\d)', t)
+    m = _RE_RANGE.search(t)
     if not m:
         return "-", "-"
     return m.group(1), m.group(2)
 
+# kind/side 키워드를 하나의 alternation 으로 묶어 1회 스캔 (group 이름 -> (kind, sell 여부))
+# - "저항 준비" 는 "저항" 보다 먼저 (prism + sell 동시 태그)
+# - ✅ CHANGE: "구간\s*[1-9]" 문자열 포함이 아니라 정규식으로 안정 판별
+_KW_GROUPS = (
+    ("prism_sell", r"저항 준비", "prism", True),
+    ("barcode", r"barcode|바코드", "barcode", False),
+    ("prism", r"prism|프리즘|지지 준비|구간\s*\d+", "prism", False),
+    ("rsi", r"rsi", "rsi", False),
+    ("panterra", r"pan\s*terra|판테라", "panterra", False),
+    ("sell", r"short|sell|매도|노랑별|저항|숏", None, True),
+)
+_RE_SIGNAL_KW = re.compile("|".join(f"(?P<{g}>{p})" for g, p, _, _ in _KW_GROUPS))
+_KW_TAGS = {g: (kind, sell) for g, _, kind, sell in _KW_GROUPS}
+_KIND_ORDER = ("barcode", "prism", "rsi", "panterra")  # 판별 우선순위
+_KIND_FIELDS = ("strategy", "strategy_name", "indicator", "title", "name", "message", "comment")
+
+def _signal_fields(payload: Dict[str, Any], raw_text: str) -> List[str]:
+    """
+    kind/side 판별 대상 문자열 (필드별 1회 lower)
+    - 주요 필드 + raw_text 먼저, 나머지 key/value 는 기존 str(payload) 판별 범위 유지용
+    """
+    fields = [str(payload.get(k, "")).lower() for k in _KIND_FIELDS]
+    fields.append(raw_text.lower())
+    for k, v in payload.items():
+        fields.append(str(k).lower())
+        if k not in _KIND_FIELDS:
+            fields.append(str(v).lower())
+    return fields
+
 def infer_signal(payload: Dict[str, Any]) -> Dict[str, Any]:
     raw_text = str(payload.get("text", "") or payload.get("message", "") or payload.get("comment", "") or "")
 
@@ -779,34 +1133,15 @@ def infer_signal(payload: Dict[str, Any]) -> Dict[str, Any]:
     tf = str(payload.get("interval") or payload.get("timeframe") or payload.get("tf") or payload.get("period") or "")
     action = str(payload.get("action") or payload.get("side") or payload.get("signal") or payload.get("order_action") or "").lower()
 
-    blob = " | ".join(
-        [
-            str(payload.get("strategy", "")),
-            str(payload.get("strategy_name", "")),
-            str(payload.get("indicator", "")),
-            str(payload.get("title", "")),
-            str(payload.get("name", "")),
-            str(payload.get("message", "")),
-            str(payload.get("comment", "")),
-            raw_text,
-            str(payload),
-        ]
-    ).lower()
-
-    kind = "unknown"
-    if ("barcode" in blob) or ("바코드" in blob):
-        kind = "barcode"
-    # ✅ CHANGE: "구간\s*[1-9]" 문자열 포함이 아니라 정규식으로 안정 판별
-    elif ("prism" in blob) or ("프리즘" in blob) or ("지지 준비" in blob) or ("저항 준비" in blob) or re.search(r"구간\s*\d+", blob):
-        kind = "prism"
-    elif ("rsi" in blob) or re.search(r"\brsi\b", blob):
-        kind = "rsi"
-    elif ("panterra" in blob) or ("판테라" in blob) or re.search(r"pan\s*terra", blob):
-        kind = "panterra"
-
-    side = "buy"
-    if any(x in blob for x in ["short", "sell", "매도", "노랑별", "저항", "숏"]):
-        side = "sell"
+    kinds, side = set(), "buy"
+    for m in _RE_SIGNAL_KW.finditer(" | ".join(_signal_fields(payload, raw_text))):
+        k, sell = _KW_TAGS[m.lastgroup]
+        if k:
+            kinds.add(k)
+        if sell:
+            side = "sell"
+    kind = next((k for k in _KIND_ORDER if k in kinds), "unknown")
+
     if any(x in action for x in ["sell", "short"]):
         side = "sell"
     if any(x in action for x in ["buy", "long"]):
@@ -881,22 +1216,25 @@ def panterra_throttle(symbol: str, side: str, sec=1800) -> bool:
     k = f"throttle:panterra:{symbol}:{side}"
     now = int(time.time())
 
-    # Redis 우선
-    last = R.get(k)
-    if last is not None:
-        try:
-            if now - int(last) < sec:
-                return True
-        except:
-            pass
-        R.set(k, str(now))
-        return False
+    # 메모리 우선 (만료 전이면 Redis 왕복 없이 판정)
+    if MEM_THROTTLE.get(k, 0) > now:
+        return True
+
+    # 다른 워커가 발송했는지 Redis 확인
+    last = asi(R.get(k), -1)
+    if last >= 0 and now - last < sec:
+        MEM_THROTTLE[k] = last + sec
+        return True
 
-    # Redis 없을 때 메모리 fallback
-    last_mem = MEM_THROTTLE.get(k)
-    if last_mem is not None and (now - int(last_mem) < sec):
+    # check 와 기록 사이에 I/O 가 없어 GIL/gevent 하에서 단일 대입으로 선점
+    if MEM_THROTTLE.get(k, 0) > now:
         return True
-    MEM_THROTTLE[k] = now
+    MEM_THROTTLE[k] = now + sec
+    _REDIS_EXEC.submit(R.cmd, ["SET", k, str(now), "EX", sec])
+
+    if len(MEM_THROTTLE) > 256:
+        for x in [x for x, exp in MEM_THROTTLE.items() if exp <= now]:
+            MEM_THROTTLE.pop(x, None)
     return False
 
 def build_signal_msg(payload: Dict[str, Any]) -> Optional[str]:
@@ -919,11 +1257,39 @@ def build_signal_msg(payload: Dict[str, Any]) -> Optional[str]:
 def pkey(symbol: str, side: str) -> str:
     return f"{symbol}|{side}"
 
+# ✅ 포지션별 hash field 로 저장 -> 매 tick 변경분만 HSET/HDEL
+_OPEN_KEY = "state:open_positions"
+
 def open_state() -> Dict[str, Dict[str, Any]]:
-    return rget_json("state:open_positions", {})
+    h = R.hgetall(_OPEN_KEY)
+    if h is None:
+        # 구버전(JSON 문자열 1개) 저장분이면 hash 로 1회 이전
+        m = rget_json(_OPEN_KEY, {})
+        if isinstance(m, dict) and m:
+            R.pipeline([["DEL", _OPEN_KEY], *save_open_state_cmd(m, {})])
+        return m if isinstance(m, dict) else {}
+    out: Dict[str, Dict[str, Any]] = {}
+    for k, v in h.items():
+        j = pjson(v, None)
+        if isinstance(j, dict):
+            out[k] = j
+    return out
 
-def save_open_state(m: Dict[str, Dict[str, Any]]):
-    rset_json("state:open_positions", m)
+def save_open_state_cmd(m: Dict[str, Dict[str, Any]], prev: Dict[str, Dict[str, Any]]) -> List[List[Any]]:
+    """
+    prev 대비 바뀐 포지션만 HSET, 사라진 포지션은 HDEL (pipeline 용 명령 리스트)
+    """
+    ops: List[List[Any]] = []
+    hs: List[Any] = ["HSET", _OPEN_KEY]
+    for k, v in m.items():
+        if prev.get(k) != v:
+            hs += [k, sjson(v)]
+    if len(hs) > 2:
+        ops.append(hs)
+    gone = [k for k in prev if k not in m]
+    if gone:
+        ops.append(["HDEL", _OPEN_KEY, *gone])
+    return ops
 
 def init_done() -> bool:
     return (R.get("state:init_done") or "") == "1"
@@ -931,33 +1297,86 @@ def init_done() -> bool:
 def mark_init_done():
     R.set("state:init_done", "1")
 
-def sess_get(k: str) -> Dict[str, Any]:
-    return rget_json(f"sess:position:{k}", {})
+def sess_key(k: str) -> str:
+    return f"sess:position:{k}"
+
+def sess_mget(keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    여러 세션을 MGET 1회로 조회 (없거나 깨진 값은 {})
+    """
+    return {k: pjson(v, {}) for k, v in zip(keys, R.mget([sess_key(k) for k in keys]))}
 
-def sess_set(k: str, v: Dict[str, Any]):
-    rset_json(f"sess:position:{k}", v)
+def sess_set_cmd(k: str, v: Dict[str, Any]) -> List[Any]:
+    return ["SET", sess_key(k), sjson(v)]
 
-def sess_del(k: str):
-    R.delete(f"sess:position:{k}")
+def sess_del_cmd(k: str) -> List[Any]:
+    return ["DEL", sess_key(k)]
 
 def hist_key(d: str) -> str:
     return f"history:trades:{d}"
 
-def hist_push(tr: Dict[str, Any]):
+# 날짜별 파싱 결과 캐시: d -> ((LLEN, LINDEX 0), rows)
+_HIST_CACHE: Dict[str, Tuple[Tuple[Any, Any], List[Dict[str, Any]]]] = {}
+_HIST_CACHE_MAX = 8
+
+def hist_push_cmd(tr: Dict[str, Any]) -> List[List[Any]]:
     d = (iso_parse(tr.get("close_ts", "")) or now_kst()).astimezone(KST).strftime("%Y-%m-%d")
-    rpush_json(hist_key(d), tr, keep=5000)
+    _HIST_CACHE.pop(d, None)
+    return rpush_json_cmd(hist_key(d), tr, keep=5000)
 
-def hist_list(d: str) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    for s in R.lrange(hist_key(d), 0, 5000):
-        j = pjson(s, None)
-        if isinstance(j, dict):
-            out.append(j)
-    return out
+def _kst_iso_ok(s: Any) -> bool:
+    # now_kst().isoformat() 형식(초 또는 마이크로초 6자리 + "+09:00")이면 문자열 비교 = 시각 비교
+    return type(s) is str and s.endswith("+09:00") and (len(s) == 25 or (len(s) == 32 and s[19] == ".")) and s[10] == "T"
+
+def _hist_in(j: Dict[str, Any], start: datetime, end: datetime, bounds: Optional[Tuple[str, str]] = None) -> bool:
+    """
+    close_ts 가 [start, end] 안인지
+    bounds: (start, end) 의 KST isoformat - close_ts 가 같은 형식이면 파싱 없이 문자열 비교
+    """
+    ts = j.get("close_ts", "")
+    if bounds and _kst_iso_ok(ts):
+        return bounds[0] <= ts <= bounds[1]
+    c = iso_parse(ts)
+    return bool(c) and start <= c.astimezone(KST) <= end
+
+def hist_range(d: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """
+    ✅ d 일자 기록 중 [start, end] 구간 row
+    - LRANGE 0..5000 1회로 원자적 조회, 파싱 결과는 (길이, 맨 앞 원소) 버전으로 캐시
+      (LPUSH 리스트라 push 가 있으면 둘 다 바뀜 → 캐시가 있을 때만 LLEN/LINDEX 로 확인)
+    (반환 row 는 공유 객체이므로 호출측에서 수정하지 않음)
+    """
+    k = hist_key(d)
+    rows: Optional[List[Dict[str, Any]]] = None
+    hit = _HIST_CACHE.get(d)
+    if hit:
+        llen, head = R.pipeline([["LLEN", k], ["LINDEX", k, 0]])
+        if llen is not None and hit[0] == (llen, head):
+            rows = hit[1]
+    if rows is None:
+        raw = R.lrange(k, 0, 5000)
+        rows = []
+        for s in raw:
+            j = pjson(s, None)
+            if isinstance(j, dict):
+                rows.append(j)
+        if len(_HIST_CACHE) >= _HIST_CACHE_MAX:
+            _HIST_CACHE.pop(next(iter(_HIST_CACHE)), None)
+        _HIST_CACHE[d] = ((len(raw), raw[0] if raw else None), rows)
+    b = (start.astimezone(KST).isoformat(), end.astimezone(KST).isoformat())
+    bounds = b if _kst_iso_ok(b[0]) and _kst_iso_ok(b[1]) else None
+    return [j for j in rows if _hist_in(j, start, end, bounds)]
 
 
 # ====== ✅ 수정(1): income 기반 분해/정산 함수 추가 + fee_calc 교체 (그 외 로직/포맷 영향 없음) ======
-def _income_split(symbol: str, st: datetime, en: datetime) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+_FEE_RE = re.compile(r"commission|fee|fund")  # "fund" 가 "funding" 포함
+_INC_KEYS = ("income", "profit", "amount", "realizedPnl")
+_INC_SYM_KEYS = ("symbol", "contract", "ticker")
+_INC_TYPE_KEYS = ("incomeType", "type", "bizType", "income_type")
+
+def _income_split(
+    symbol: str, st: datetime, en: datetime, cache: Optional[Dict[Tuple[str, str], Tuple[Any, Any, Any]]] = None
+) -> Tuple[Optional[float], Optional[float], Optional[float]]:
     """
     ✅ 거래소 정산(income) 기반으로
     - closed_pnl(정산 손익)
@@ -966,7 +1385,13 @@ def _income_split(symbol: str, st: datetime, en: datetime) -> Tuple[Optional[flo
     를 최대한 안정적으로 분해해서 리턴
 
     실패(None)면 호출부에서 기존 추정치 로직으로 fallback
+    cache: 같은 tick 안에서 (symbol, 시작시각) 재조회 방지용 dict (process_positions 가 넘김)
     """
+    if cache is not None:
+        ck = (symbol, st.isoformat())
+        if ck not in cache:
+            cache[ck] = _income_split(symbol, st, en)
+        return cache[ck]
     recs = fetch_income(symbol, int(st.astimezone(UTC).timestamp() * 1000), int(en.astimezone(UTC).timestamp() * 1000))
     if not recs:
         return None, None, None
@@ -977,23 +1402,27 @@ def _income_split(symbol: str, st: datetime, en: datetime) -> Tuple[Optional[flo
 
     # ✅ 혹시 API가 심볼 필터를 무시/느슨하게 처리하는 경우가 있어서
     #    응답에 섞여 들어온 다른 심볼 income을 2차로 걸러줌 (Realized 튐 방지)
-    req_norm = re.sub(r"[^A-Za-z0-9]", "", symbol).upper()
+    req_norm = _NON_ALNUM.sub("", symbol).upper()
+    norms: Dict[str, str] = {}  # 같은 심볼이 반복되므로 정규화 결과 재사용
+    _asf, _fst = asf, _first
 
     for r in recs:
-        rec_sym = str(r.get("symbol") or r.get("contract") or r.get("ticker") or "").strip()
+        rec_sym = str(_fst(r, _INC_SYM_KEYS, "")).strip()
         if rec_sym:
-            rec_norm = re.sub(r"[^A-Za-z0-9]", "", rec_sym).upper()
+            rec_norm = norms.get(rec_sym)
+            if rec_norm is None:
+                rec_norm = norms[rec_sym] = _NON_ALNUM.sub("", rec_sym).upper()
             if req_norm and rec_norm and (req_norm not in rec_norm and rec_norm not in req_norm):
                 continue
 
-        typ = str(r.get("incomeType") or r.get("type") or r.get("bizType") or r.get("income_type") or "").lower()
-        inc = asf(r.get("income") or r.get("profit") or r.get("amount") or r.get("realizedPnl") or 0)
+        typ = str(_fst(r, _INC_TYPE_KEYS, "")).lower()
+        inc = _asf(_fst(r, _INC_KEYS, 0))
 
         # income 원본 합 = 최종 실현(거래소 정산에 가장 가까운 기준)
         realized_sum += inc
 
         # 수수료/펀딩은 타입 키워드로 최대한 분리
-        if any(x in typ for x in ["commission", "fee", "funding", "fund"]):
+        if _FEE_RE.search(typ):
             fee_funding_sum += inc
             continue
 
@@ -1003,12 +1432,15 @@ def _income_split(symbol: str, st: datetime, en: datetime) -> Tuple[Optional[flo
     return closed_sum, fee_funding_sum, realized_sum
 
 
-def fee_calc(symbol: str, st: datetime, en: datetime, closed: float, entry_v: float, exit_v: float) -> Tuple[float, float, float]:
+def fee_calc(
+    symbol: str, st: datetime, en: datetime, closed: float, entry_v: float, exit_v: float,
+    cache: Optional[Dict[Tuple[str, str], Tuple[Any, Any, Any]]] = None,
+) -> Tuple[float, float, float]:
     """
     ✅ CLOSE 정산값을 서로 일치시키기 위한 계산
     - return: (closed_pnl, fee_funding, realized)
     """
-    c, ff, real = _income_split(symbol, st, en)
+    c, ff, real = _income_split(symbol, st, en, cache)
     if c is not None:
         # income 기반 확정
         return c, ff, (c + ff)
@@ -1021,31 +1453,19 @@ def fee_calc(symbol: str, st: datetime, en: datetime, closed: float, entry_v: fl
 
 
 def send_signal_alert(text: str):
-    sent = 0
-    for cid in CHAT_IDS:
-        if (not is_group(cid)) or sw_get("signal", cid) == "1":
-            if tg_send(BOT_TOKEN, cid, text):
-                sent += 1
-    logging.info("signal alert sent=%s/%s", sent, len(CHAT_IDS))
+    cids = alert_targets("signal")
+    logging.info("signal alert sent=%s/%s", tg_send_bulk(BOT_TOKEN, cids, text), len(CHAT_IDS))
 
 def send_signal_alert_plain(text: str):
     """
     ✅ CHANGE: kind 미정(unknown) 원문 그대로 발송(포맷/마크다운 없음)
     """
-    sent = 0
-    for cid in CHAT_IDS:
-        if (not is_group(cid)) or sw_get("signal", cid) == "1":
-            if tg_send_plain(BOT_TOKEN, cid, text):
-                sent += 1
-    logging.info("signal alert plain sent=%s/%s", sent, len(CHAT_IDS))
+    cids = alert_targets("signal")
+    logging.info("signal alert plain sent=%s/%s", tg_send_bulk(BOT_TOKEN, cids, text, plain=True), len(CHAT_IDS))
 
 def send_pos_alert(text: str):
-    sent = 0
-    for cid in CHAT_IDS_POSITION:
-        if (not is_group(cid)) or sw_get("position", cid) == "1":
-            if tg_send(BOT_TOKEN_POSITION, cid, text):
-                sent += 1
-    logging.info("position alert sent=%s/%s", sent, len(CHAT_IDS_POSITION))
+    cids = alert_targets("position")
+    logging.info("position alert sent=%s/%s", tg_send_bulk(BOT_TOKEN_POSITION, cids, text), len(CHAT_IDS_POSITION))
 
 # -----------------------
 # 이하 (포지션/리포트/명령/라우트/부트스트랩) 원본 그대로
@@ -1054,23 +1474,29 @@ def send_pos_alert(text: str):
 
 def process_positions(send_alert=True) -> Dict[str, Any]:
     cur: Dict[str, Dict[str, Any]] = {}
-    for p in fetch_positions():
+    for p in fetch_positions_cached():
         cur[pkey(p["symbol"], p["side"])] = p
     prev = open_state()
 
+    # tick 단위 income 캐시: 같은 (symbol, start_ts) 는 거래소 1회만 조회
+    income_cache: Dict[Tuple[str, str], Tuple[Any, Any, Any]] = {}
+
     # ====== ✅ 수정(2): rPnL 표시를 세션 시작 이후 income 합계로 보강 (표시만, 로직/포맷 불변) ======
     def _rpnL_since(symbol: str, start_iso: str) -> Optional[float]:
         st = iso_parse(start_iso) or now_kst()
         en = now_kst()
-        c, ff, real = _income_split(symbol, st, en)
+        c, ff, real = _income_split(symbol, st, en, income_cache)
         if real is None:
             return None
         return real
     # ====== ✅ 수정(2) 끝 ======
 
+    # 세션/상태 쓰기는 ops 에 모아 마지막에 pipeline 1회로 반영
+    ops: List[List[Any]] = []
+
     if not init_done():
         for k, p in cur.items():
-            sess_set(
+            ops.append(sess_set_cmd(
                 k,
                 {
                     "symbol": p["symbol"],
@@ -1087,13 +1513,16 @@ def process_positions(send_alert=True) -> Dict[str, Any]:
                     "last_mark_price": p["mark_price"],
                     "last_r_pnl": p["r_pnl"],
                 },
-            )
-        save_open_state(cur)
-        mark_init_done()
+            ))
+        ops += [["DEL", _OPEN_KEY], *save_open_state_cmd(cur, {}), ["SET", "state:init_done", "1"]]
+        R.pipeline(ops)
+        fetch_positions_cache_clear()
         return {"ok": True, "initial_sync": True, "positions_now": len(cur), "events": {"open": 0, "add": 0, "reduce": 0, "close": 0}, "closed_trades": []}
 
     events = {"open": 0, "add": 0, "reduce": 0, "close": 0}
     closed_rows: List[Dict[str, Any]] = []
+    # 기존 세션(add/reduce/close 대상)은 MGET 1회로 선조회
+    sessions = sess_mget([k for k in cur if prev.get(k)] + [k for k in prev if k not in cur])
 
     # open/add/reduce
     for k, p in cur.items():
@@ -1101,7 +1530,7 @@ def process_positions(send_alert=True) -> Dict[str, Any]:
         if not o:
             events["open"] += 1
             start_iso = now_kst().isoformat()
-            sess_set(
+            ops.append(sess_set_cmd(
                 k,
                 {
                     "symbol": p["symbol"],
@@ -1118,17 +1547,13 @@ def process_positions(send_alert=True) -> Dict[str, Any]:
                     "last_mark_price": p["mark_price"],
                     "last_r_pnl": p["r_pnl"],
                 },
-            )
+            ))
             if send_alert:
                 # ✅ rPnL 표시 보강(알림 표시만)
-                p_show = dict(p)
-                rp = _rpnL_since(p.get("symbol", ""), start_iso)
-                if rp is not None:
-                    p_show["r_pnl"] = rp
-                send_pos_alert(tpl_open(p_show))
+                send_pos_alert(tpl_open(p, _rpnL_since(p.get("symbol", ""), start_iso)))
         else:
             q0, q1 = asf(o.get("qty")), asf(p.get("qty"))
-            s = sess_get(k) or {
+            s = sessions.get(k) or {
                 "symbol": p["symbol"],
                 "side": p["side"],
                 "base": p["base"],
@@ -1146,11 +1571,7 @@ def process_positions(send_alert=True) -> Dict[str, Any]:
                 s["total_entry_value"] = asf(s.get("total_entry_value")) + max(dv, 0.0)
                 if send_alert:
                     # ✅ rPnL 표시 보강(알림 표시만)
-                    p_show = dict(p)
-                    rp = _rpnL_since(p.get("symbol", ""), str(s.get("start_ts", "")))
-                    if rp is not None:
-                        p_show["r_pnl"] = rp
-                    send_pos_alert(tpl_add(o, p_show))
+                    send_pos_alert(tpl_add(o, p, _rpnL_since(p.get("symbol", ""), str(s.get("start_ts", "")))))
 
             elif q1 + 1e-12 < q0:
                 events["reduce"] += 1
@@ -1159,11 +1580,7 @@ def process_positions(send_alert=True) -> Dict[str, Any]:
                 s["total_exit_value"] = asf(s.get("total_exit_value")) + max(rv, 0.0)
                 if send_alert:
                     # ✅ rPnL 표시 보강(알림 표시만)
-                    p_show = dict(p)
-                    rp = _rpnL_since(p.get("symbol", ""), str(s.get("start_ts", "")))
-                    if rp is not None:
-                        p_show["r_pnl"] = rp
-                    send_pos_alert(tpl_reduce(o, p_show))
+                    send_pos_alert(tpl_reduce(o, p, _rpnL_since(p.get("symbol", ""), str(s.get("start_ts", "")))))
 
             s.update(
                 {
@@ -1175,14 +1592,14 @@ def process_positions(send_alert=True) -> Dict[str, Any]:
                     "leverage": p["leverage"],
                 }
             )
-            sess_set(k, s)
+            ops.append(sess_set_cmd(k, s))
 
     # close
     for k, o in prev.items():
         if k in cur:
             continue
         events["close"] += 1
-        s = sess_get(k) or {
+        s = sessions.get(k) or {
             "symbol": o.get("symbol"),
             "side": o.get("side"),
             "base": o.get("base", base_asset(o.get("symbol", ""))),
@@ -1202,7 +1619,7 @@ def process_positions(send_alert=True) -> Dict[str, Any]:
         closed = (tv_out - tv_in) if s.get("side") == "Long" else (tv_in - tv_out)
         st = iso_parse(s.get("start_ts", "")) or now_kst()
         en = now_kst()
-        closed_pnl, fee, real = fee_calc(s.get("symbol", ""), st, en, closed, tv_in, tv_out)
+        closed_pnl, fee, real = fee_calc(s.get("symbol", ""), st, en, closed, tv_in, tv_out, income_cache)
 
         row = {
             "symbol": s.get("symbol"),
@@ -1213,13 +1630,13 @@ def process_positions(send_alert=True) -> Dict[str, Any]:
             "close_price": close_p,
             "total_entry_value": tv_in,
             "total_exit_value": tv_out,
-            "closed_pnl": float(f"{closed_pnl:.8f}"),
-            "fee_funding": float(f"{fee:.8f}"),
-            "realized": float(f"{real:.8f}"),
+            "closed_pnl": round(closed_pnl, 8),
+            "fee_funding": round(fee, 8),
+            "realized": round(real, 8),
             "margin_mode": s.get("margin_mode", "Isolated"),
             "leverage": s.get("leverage", 1),
         }
-        hist_push(row)
+        ops += hist_push_cmd(row)
         closed_rows.append(row)
 
         if send_alert:
@@ -1241,15 +1658,15 @@ def process_positions(send_alert=True) -> Dict[str, Any]:
                     row["realized"],
                 )
             )
-        sess_del(k)
+        ops.append(sess_del_cmd(k))
 
-    save_open_state(cur)
+    ops += save_open_state_cmd(cur, prev)
+    R.pipeline(ops)
+    fetch_positions_cache_clear()  # 다음 tick 은 항상 새로 조회
     return {"ok": True, "positions_now": len(cur), "events": events, "closed_trades": closed_rows}
 
 # ===== Report =====
 def rows_until(date_str: str, end_dt: datetime) -> List[Dict[str, Any]]:
-    rows = hist_list(date_str)
-    out: List[Dict[str, Any]] = []
     start = datetime.strptime(date_str + " 00:00:00", "%Y-%m-%d %H:%M:%S").replace(tzinfo=KST)
     today = now_kst().strftime("%Y-%m-%d")
     end_limit = (
@@ -1257,27 +1674,28 @@ def rows_until(date_str: str, end_dt: datetime) -> List[Dict[str, Any]]:
         if date_str == today
         else datetime.strptime(date_str + " 23:59:59", "%Y-%m-%d %H:%M:%S").replace(tzinfo=KST)
     )
-    for r in rows:
-        c = iso_parse(r.get("close_ts", ""))
-        if c and start <= c.astimezone(KST) <= end_limit:
-            out.append(r)
-    return out
+    return hist_range(date_str, start, end_limit)
 
 def report_summary_text(date_str: str, now_dt: datetime, rows: List[Dict[str, Any]]) -> str:
     total = len(rows)
-    win = sum(1 for r in rows if (asf(r.get("closed_pnl")) + asf(r.get("fee_funding"))) > 0)
-    lose = total - win
-    wr = (win / total * 100) if total else 0
-
-    s_closed = sum(asf(r.get("closed_pnl")) for r in rows)
-    s_fee = sum(asf(r.get("fee_funding")) for r in rows)
-    s_real = s_closed + s_fee
-
+    win = 0
+    s_closed = s_fee = 0.0
     cnt: Dict[str, int] = {}
+    # 승패/합계/종목수 1회 순회로 집계
     for r in rows:
+        cp = asf(r.get("closed_pnl"))
+        ff = asf(r.get("fee_funding"))
+        s_closed += cp
+        s_fee += ff
+        if cp + ff > 0:
+            win += 1
         sym = str(r.get("symbol", ""))
         if sym:
             cnt[sym] = cnt.get(sym, 0) + 1
+    lose = total - win
+    wr = (win / total * 100) if total else 0
+    s_real = s_closed + s_fee
+
     sym_text = ", ".join([f"{k}({v})" for k, v in sorted(cnt.items())]) if cnt else "-"
 
     st = f"{date_str[5:]} 00:00"
@@ -1297,9 +1715,6 @@ def report_summary_text(date_str: str, now_dt: datetime, rows: List[Dict[str, An
 def report_detail_text(date_str: str, now_dt: datetime, rows: List[Dict[str, Any]]) -> str:
     st = f"{date_str[5:]} 00:00"
     en = now_dt.astimezone(KST).strftime("%H:%M")
-    s_closed = sum(asf(r.get("closed_pnl")) for r in rows)
-    s_fee = sum(asf(r.get("fee_funding")) for r in rows)
-    s_real = s_closed + s_fee
 
     p = ["📑 *일일 상세 리포트*", "━━━━━━━━━━━━━━", f"기간 : {st} ~ {en} (KST)", ""]
     if not rows:
@@ -1314,10 +1729,16 @@ def report_detail_text(date_str: str, now_dt: datetime, rows: List[Dict[str, Any
         ]
         return "\n".join(p)
 
+    # 합계는 행 출력과 같은 루프에서 누적
+    s_closed = s_fee = 0.0
     for r in sorted(rows, key=lambda x: x.get("close_ts", "")):
         sd = iso_parse(r.get("start_ts", "")) or now_dt
         cd = iso_parse(r.get("close_ts", "")) or now_dt
         per = f"{sd.astimezone(KST).strftime('%m-%d %H:%M')} ~ {cd.astimezone(KST).strftime('%H:%M')} (KST)"
+        cp = asf(r.get("closed_pnl"))
+        ff = asf(r.get("fee_funding"))
+        s_closed += cp
+        s_fee += ff
         p += [
             f"✅ {r.get('symbol','')} ({r.get('side','')})",
             f"기간       : {per}",
@@ -1325,11 +1746,12 @@ def report_detail_text(date_str: str, now_dt: datetime, rows: List[Dict[str, Any
             f"종료가     : {fmt_price(asf(r.get('close_price')))} USDT",
             f"총 진입금액 : {fmt_num(asf(r.get('total_entry_value')),2)} USDT",
             f"총 종료금액 : {fmt_num(asf(r.get('total_exit_value')),2)} USDT",
-            f"Closed PnL : {sign(asf(r.get('closed_pnl')))} USDT",
-            f"Fee+Funding: {sign(asf(r.get('fee_funding')))} USDT",
-            f"*Realized   : {sign((asf(r.get('closed_pnl')) + asf(r.get('fee_funding'))))} USDT*",
+            f"Closed PnL : {sign(cp)} USDT",
+            f"Fee+Funding: {sign(ff)} USDT",
+            f"*Realized   : {sign(cp + ff)} USDT*",
             "",
         ]
+    s_real = s_closed + s_fee
 
     p += [
         "━━━━━━━━━━━━━━",
@@ -1340,29 +1762,46 @@ def report_detail_text(date_str: str, now_dt: datetime, rows: List[Dict[str, Any
     ]
     return "\n".join(p)
 
-def send_report_summary(chat_id: str, date_str: Optional[str] = None):
+def report_summary_now(date_str: Optional[str] = None) -> str:
     now = now_kst()
     date_str = date_str or now.strftime("%Y-%m-%d")
-    tg_send(BOT_TOKEN_POSITION, chat_id, report_summary_text(date_str, now, rows_until(date_str, now)))
+    return report_summary_text(date_str, now, rows_until(date_str, now))
+
+def send_report_summary(chat_id: str, date_str: Optional[str] = None):
+    tg_send(BOT_TOKEN_POSITION, chat_id, report_summary_now(date_str))
 
 def send_report_detail(chat_id: str, date_str: Optional[str] = None):
     now = now_kst()
     date_str = date_str or now.strftime("%Y-%m-%d")
     tg_send_chunk(BOT_TOKEN_POSITION, chat_id, report_detail_text(date_str, now, rows_until(date_str, now)))
 
+# 자동 리포트 on/시각 설정은 60초마다만 Redis 에서 갱신 (cfg_set 시 즉시 무효화)
+_AUTO_CFG_KEYS = ("report_auto", "report_auto_hour", "report_auto_minute")
+_AUTO_CFG_TTL = 60.0
+_auto_cfg: Dict[str, Any] = {"t": None, "on": False, "hour": REPORT_AUTO_HOUR_DEFAULT, "minute": REPORT_AUTO_MINUTE_DEFAULT}
+
+def _auto_cfg_load() -> Dict[str, Any]:
+    t = _auto_cfg["t"]
+    if t is None or time.monotonic() - t > _AUTO_CFG_TTL:
+        cfg_init()
+        _auto_cfg.update(
+            on=cfg_get("report_auto", "off").lower() == "on",
+            hour=asi(cfg_get("report_auto_hour", str(REPORT_AUTO_HOUR_DEFAULT)), REPORT_AUTO_HOUR_DEFAULT),
+            minute=asi(cfg_get("report_auto_minute", str(REPORT_AUTO_MINUTE_DEFAULT)), REPORT_AUTO_MINUTE_DEFAULT),
+            t=time.monotonic(),
+        )
+    return _auto_cfg
+
 def maybe_auto_report() -> Dict[str, Any]:
     """
     ✅ 자동 리포트: 매일 23:50에만 1회 발송
     """
-    cfg_init()
-    if cfg_get("report_auto", "off").lower() != "on":
+    ac = _auto_cfg_load()
+    if not ac["on"]:
         return {"sent": False, "reason": "auto_off"}
 
-    hour = asi(cfg_get("report_auto_hour", str(REPORT_AUTO_HOUR_DEFAULT)), REPORT_AUTO_HOUR_DEFAULT)
-    minute = asi(cfg_get("report_auto_minute", str(REPORT_AUTO_MINUTE_DEFAULT)), REPORT_AUTO_MINUTE_DEFAULT)
-
     now = now_kst()
-    if now.hour != hour or now.minute != minute:
+    if now.hour != ac["hour"] or now.minute != ac["minute"]:
         return {"sent": False, "reason": "not_target_time"}
 
     slot = now.strftime("%Y-%m-%d %H:%M")
@@ -1373,6 +1812,10 @@ def maybe_auto_report() -> Dict[str, Any]:
     if not chat:
         return {"sent": False, "reason": "no_target_chat"}
 
+    # 동시 호출(/positions_check, /health_check, 다른 워커) 중복 발송 방지: slot 선점은 원자적으로
+    if R.cmd(["SET", f"lease:report_auto:{slot}", "1", "NX", "EX", 3600]) != "OK":
+        return {"sent": False, "reason": "already_sent"}
+
     send_report_summary(chat, now.strftime("%Y-%m-%d"))
     cfg_set("report_auto_last_slot", slot)
     return {"sent": True, "slot": slot, "chat_id": chat}
@@ -1391,12 +1834,10 @@ def status_text() -> str:
     h = cfg_get("report_auto_hour", str(REPORT_AUTO_HOUR_DEFAULT))
     m = cfg_get("report_auto_minute", str(REPORT_AUTO_MINUTE_DEFAULT))
     lines = ["🧾 *현재 상태 (/status)*", "━━━━━━━━━━━━━━"]
-    for cid in CHAT_IDS:
-        if is_group(cid):
-            lines.append(f"Signal Group : {cid} : {'ON' if sw_get('signal',cid)=='1' else 'OFF'}")
-    for cid in CHAT_IDS_POSITION:
-        if is_group(cid):
-            lines.append(f"Position Group : {cid} : {'ON' if sw_get('position',cid)=='1' else 'OFF'}")
+    for cid, v in sw_many("signal", list(_GROUP_IDS["signal"])).items():
+        lines.append(f"Signal Group : {cid} : {'ON' if v=='1' else 'OFF'}")
+    for cid, v in sw_many("position", list(_GROUP_IDS["position"])).items():
+        lines.append(f"Position Group : {cid} : {'ON' if v=='1' else 'OFF'}")
     lines += [
         "",
         f"Report Auto : {cfg_get('report_auto','off').upper()} (매일 {int(h):02d}:{int(m):02d})",
@@ -1407,12 +1848,11 @@ def status_text() -> str:
     return "\n".join(lines)
 
 def toggle_groups(kind: str, on: bool) -> str:
-    ids = CHAT_IDS if kind == "signal" else CHAT_IDS_POSITION
-    gs = [c for c in ids if is_group(c)]
+    gs = _GROUP_IDS[kind]
     if not gs:
         return "그룹 chat_id가 없습니다."
-    for g in gs:
-        sw_set(kind, g, on)
+    for gid in gs:
+        sw_set(kind, gid, on)
     return f"✅ {'시그널' if kind=='signal' else '포지션'} 그룹 알림을 *{'ON' if on else 'OFF'}* 으로 설정했어."
 
 def switch_logs(n=10) -> str:
@@ -1429,7 +1869,7 @@ def switch_logs(n=10) -> str:
     return "\n".join(lines)
 
 def snapshot_text() -> str:
-    ps = fetch_positions()
+    ps = fetch_positions_cached()
     if not ps:
         return f"📭 현재 오픈 포지션이 없어.\n\n🕒 {to_kst()}"
     lines = ["📌 *현재 포지션 스냅샷*", "━━━━━━━━━━━━━━"]
@@ -1448,91 +1888,95 @@ def state_reset() -> str:
     R.delete("state:init_done")
     return f"⚠️ state:open_positions / state:init_done 초기화 완료\n🕒 {to_kst()}"
 
-def handle_command(chat_id: str, uid: str, text: str) -> Optional[str]:
-    cmd, arg = parse_cmd(text)
-    if not cmd:
-        return None
-    if cmd == "/help":
-        return HELP_TEXT.format(now=to_kst())
-    if cmd == "/status":
-        return status_text()
-
-    # report 조회는 누구나 가능
-    if cmd in ("/report_summary", "/report"):
-        d = arg if re.match(r"^\d{4}-\d{2}-\d{2}$", arg or "") else None
-        send_report_summary(chat_id, d)
-        return None
-
-    if cmd == "/report_detail":
-        d = arg if re.match(r"^\d{4}-\d{2}-\d{2}$", arg or "") else None
-        send_report_detail(chat_id, d)
-        return None
-
-    if cmd == "/report_auto_status":
-        h = cfg_get("report_auto_hour", str(REPORT_AUTO_HOUR_DEFAULT))
-        m = cfg_get("report_auto_minute", str(REPORT_AUTO_MINUTE_DEFAULT))
-        return (
-            "🧾 자동 리포트 상태\n━━━━━━━━━━━━━━\n"
-            f"상태 : {cfg_get('report_auto','off').upper()}\n"
-            f"시간 : {int(h):02d}:{int(m):02d} (KST)\n"
-            f"대상 : {cfg_get('report_auto_chat','-')}\n"
-            f"최근발송 : {cfg_get('report_auto_last_slot','-')}\n\n"
-            f"🕒 {to_kst()}"
-        )
+# 명령 핸들러: (chat_id, uid, cmd, arg) -> 응답 텍스트 (None 이면 응답 없음)
+def _cmd_report_summary(chat_id: str, uid: str, cmd: str, arg: str) -> Optional[str]:
+    send_report_summary(chat_id, arg if _DATE_RE.match(arg or "") else None)
+    return None
 
-    # 이하 관리자
-    if not is_admin(uid):
-        return "권한이 없어. (ADMIN_USER_IDS 확인)"
+def _cmd_report_detail(chat_id: str, uid: str, cmd: str, arg: str) -> Optional[str]:
+    send_report_detail(chat_id, arg if _DATE_RE.match(arg or "") else None)
+    return None
 
-    if cmd == "/sig_on":
-        switch_log(cmd, uid, "signal on")
-        return toggle_groups("signal", True)
-    if cmd == "/sig_off":
-        switch_log(cmd, uid, "signal off")
-        return toggle_groups("signal", False)
-    if cmd == "/pos_on":
-        switch_log(cmd, uid, "position on")
-        return toggle_groups("position", True)
-    if cmd == "/pos_off":
-        switch_log(cmd, uid, "position off")
-        return toggle_groups("position", False)
-
-    if cmd == "/report_auto_on":
-        cfg_set("report_auto", "on")
-        cfg_set("report_auto_hour", "23")
-        cfg_set("report_auto_minute", "50")
-        return "✅ 자동 리포트 ON (매일 23:50, 요약본)"
-    if cmd == "/report_auto_off":
-        cfg_set("report_auto", "off")
-        return "✅ 자동 리포트 OFF"
-
-    if cmd in ("/say", "/say_pos"):
-        m = (arg or "").strip()
-        if not m:
-            return "사용법: /say 내용"
-        for cid in CHAT_IDS_POSITION:
-            tg_send(BOT_TOKEN_POSITION, cid, m)
-        return "✅ 포지션 수신방 공지 전송 완료"
+def _cmd_report_auto_status(chat_id: str, uid: str, cmd: str, arg: str) -> str:
+    h = cfg_get("report_auto_hour", str(REPORT_AUTO_HOUR_DEFAULT))
+    m = cfg_get("report_auto_minute", str(REPORT_AUTO_MINUTE_DEFAULT))
+    return (
+        "🧾 자동 리포트 상태\n━━━━━━━━━━━━━━\n"
+        f"상태 : {cfg_get('report_auto','off').upper()}\n"
+        f"시간 : {int(h):02d}:{int(m):02d} (KST)\n"
+        f"대상 : {cfg_get('report_auto_chat','-')}\n"
+        f"최근발송 : {cfg_get('report_auto_last_slot','-')}\n\n"
+        f"🕒 {to_kst()}"
+    )
 
-    if cmd == "/say_sig":
+def _cmd_toggle(kind: str, on: bool):
+    note = f"{kind} {'on' if on else 'off'}"
+    def fn(chat_id: str, uid: str, cmd: str, arg: str) -> str:
+        switch_log(cmd, uid, note)
+        return toggle_groups(kind, on)
+    return fn
+
+def _cmd_report_auto_on(chat_id: str, uid: str, cmd: str, arg: str) -> str:
+    cfg_set("report_auto", "on")
+    cfg_set("report_auto_hour", "23")
+    cfg_set("report_auto_minute", "50")
+    return "✅ 자동 리포트 ON (매일 23:50, 요약본)"
+
+def _cmd_report_auto_off(chat_id: str, uid: str, cmd: str, arg: str) -> str:
+    cfg_set("report_auto", "off")
+    return "✅ 자동 리포트 OFF"
+
+def _cmd_say(token: str, kind: str, usage: str, done: str):
+    def fn(chat_id: str, uid: str, cmd: str, arg: str) -> str:
         m = (arg or "").strip()
         if not m:
-            return "사용법: /say_sig 내용"
-        for cid in CHAT_IDS:
-            tg_send(BOT_TOKEN, cid, m)
-        return "✅ 시그널 수신방 공지 전송 완료"
-
-    if cmd == "/switch_logs":
-        n = int(arg) if (arg or "").isdigit() else 10
-        return switch_logs(n)
-
-    if cmd == "/pos_snapshot":
-        return snapshot_text()
-    if cmd == "/state_reset":
-        return state_reset()
-    if cmd == "/health_check":
-        return f"ok\n🕒 {to_kst()}"
+            return usage
+        tg_send_bulk(token, CHAT_IDS if kind == "signal" else CHAT_IDS_POSITION, m)
+        return done
+    return fn
+
+def _cmd_switch_logs(chat_id: str, uid: str, cmd: str, arg: str) -> str:
+    return switch_logs(int(arg) if (arg or "").isdigit() else 10)
+
+# report 조회는 누구나 가능
+_PUBLIC_CMDS = {
+    "/help": lambda c, u, cmd, a: HELP_TEXT.format(now=to_kst()),
+    "/status": lambda c, u, cmd, a: status_text(),
+    "/report_summary": _cmd_report_summary,
+    "/report": _cmd_report_summary,
+    "/report_detail": _cmd_report_detail,
+    "/report_auto_status": _cmd_report_auto_status,
+}
+
+# 이하 관리자
+_ADMIN_CMDS = {
+    "/sig_on": _cmd_toggle("signal", True),
+    "/sig_off": _cmd_toggle("signal", False),
+    "/pos_on": _cmd_toggle("position", True),
+    "/pos_off": _cmd_toggle("position", False),
+    "/report_auto_on": _cmd_report_auto_on,
+    "/report_auto_off": _cmd_report_auto_off,
+    "/say": _cmd_say(BOT_TOKEN_POSITION, "position", "사용법: /say 내용", "✅ 포지션 수신방 공지 전송 완료"),
+    "/say_pos": _cmd_say(BOT_TOKEN_POSITION, "position", "사용법: /say 내용", "✅ 포지션 수신방 공지 전송 완료"),
+    "/say_sig": _cmd_say(BOT_TOKEN, "signal", "사용법: /say_sig 내용", "✅ 시그널 수신방 공지 전송 완료"),
+    "/switch_logs": _cmd_switch_logs,
+    "/pos_snapshot": lambda c, u, cmd, a: snapshot_text(),
+    "/state_reset": lambda c, u, cmd, a: state_reset(),
+    "/health_check": lambda c, u, cmd, a: f"ok\n🕒 {to_kst()}",
+}
 
+def handle_command(chat_id: str, uid: str, text: str) -> Optional[str]:
+    cmd, arg = parse_cmd(text)
+    if not cmd:
+        return None
+    fn = _PUBLIC_CMDS.get(cmd)
+    if fn:
+        return fn(chat_id, uid, cmd, arg)
+    if not is_admin(uid):
+        return "권한이 없어. (ADMIN_USER_IDS 확인)"
+    fn = _ADMIN_CMDS.get(cmd)
+    if fn:
+        return fn(chat_id, uid, cmd, arg)
     return "알 수 없는 명령어야. /help 확인해줘."
 
 def parse_update(update: Dict[str, Any]) -> Tuple[str, str, str]:
@@ -1542,6 +1986,47 @@ def parse_update(update: Dict[str, Any]) -> Tuple[str, str, str]:
     return str(c.get("id", "")), str(u.get("id", "")), (m.get("text") or "").strip()
 
 
+# ===== Background =====
+# 포지션 체크/자동 리포트는 전용 스레드에서 실행, 라우트는 깨우기만 하고 즉시 응답
+_BG_EVENT = threading.Event()
+_BG_WANT = {"positions": False}
+_BG_LOCK = threading.Lock()  # _BG_WANT 읽기+초기화를 kick 과 원자적으로
+_BG_LAST: Dict[str, Any] = {"result": None, "auto_report": None, "time": None}
+
+def bg_kick(positions: bool):
+    if positions:
+        with _BG_LOCK:
+            _BG_WANT["positions"] = True
+    _BG_EVENT.set()
+
+def _bg_tick(positions: bool):
+    with app.app_context():
+        g._r_cache = {}
+        if positions:
+            token = lease_acquire("positions")
+            if token:
+                try:
+                    _BG_LAST["result"] = process_positions(send_alert=True)
+                finally:
+                    lease_release("positions", token)
+            else:
+                _BG_LAST["result"] = {"ok": False, "skipped": "busy"}
+        _BG_LAST["auto_report"] = maybe_auto_report()
+        _BG_LAST["time"] = to_kst()
+
+def _bg_worker():
+    while True:
+        kicked = _BG_EVENT.wait(POSITIONS_INTERVAL_SEC or None)
+        _BG_EVENT.clear()
+        with _BG_LOCK:
+            want, _BG_WANT["positions"] = _BG_WANT["positions"], False
+        positions = want or not kicked  # timeout = 주기 실행
+        try:
+            _bg_tick(positions)
+        except Exception:
+            logging.exception("background tick failed")
+
+
 # ===== Routes =====
 @app.route("/", methods=["GET"])
 def root():
@@ -1610,29 +2095,26 @@ def tg_signal():
 def positions_check():
     if POSITIONS_CHECK_TOKEN and request.args.get("token", "") != POSITIONS_CHECK_TOKEN:
         return jsonify({"ok": False, "error": "unauthorized"}), 401
-    with LOCK:
-        res = process_positions(send_alert=True)
-        auto = maybe_auto_report()
-    return jsonify({"ok": True, "result": res, "auto_report": auto, "time": to_kst()})
+    bg_kick(True)
+    # result/auto_report 는 직전 백그라운드 실행 결과
+    return jsonify({"ok": True, "queued": True, "result": _BG_LAST["result"], "auto_report": _BG_LAST["auto_report"], "last_run": _BG_LAST["time"], "time": to_kst()})
 
 @app.route("/daily_report", methods=["GET", "POST"])
 def daily_report():
     if DAILY_REPORT_TOKEN and request.args.get("token", "") != DAILY_REPORT_TOKEN:
         return jsonify({"ok": False, "error": "unauthorized"}), 401
     d = request.args.get("date", "").strip()
-    if not re.match(r"^\d{4}-\d{2}-\d{2}$", d or ""):
+    if not _DATE_RE.match(d or ""):
         d = None
-    sent = 0
-    for cid in CHAT_IDS_POSITION:
-        send_report_summary(cid, d)
-        sent += 1
+    # 리포트는 1회만 만들고 전 chat 에 병렬 발송
+    tg_send_bulk(BOT_TOKEN_POSITION, CHAT_IDS_POSITION, report_summary_now(d))
+    sent = len(CHAT_IDS_POSITION)
     return jsonify({"ok": True, "sent": sent, "date": d or now_kst().strftime("%Y-%m-%d")})
 
 @app.route("/health_check", methods=["GET"])
 def health():
-    with LOCK:
-        auto = maybe_auto_report()
-    return jsonify({"ok": True, "auto_report": auto, "time": to_kst()})
+    bg_kick(False)
+    return jsonify({"ok": True, "auto_report": _BG_LAST["auto_report"], "time": to_kst()})
 
 
 # ===== Bootstrap =====
@@ -1642,16 +2124,22 @@ def bootstrap():
     if om and not init_done():
         mark_init_done()
 
-    for cid in CHAT_IDS:
-        if is_group(cid) and R.get(sw_key("signal", cid)) is None:
-            sw_set("signal", cid, False)
-    for cid in CHAT_IDS_POSITION:
-        if is_group(cid) and R.get(sw_key("position", cid)) is None:
-            sw_set("position", cid, False)
+    # 스위치 hash 에 없는 그룹은 구버전 개별 key 값(없으면 OFF)으로 채움
+    for kind, gs in _GROUP_IDS.items():
+        h = R.hgetall(sw_hkey(kind))
+        if h is None:
+            continue
+        miss = [c for c in gs if c not in h]
+        if miss:
+            old = R.mget([sw_key(kind, c) for c in miss])
+            R.cmd(["HSET", sw_hkey(kind), *[x for c, v in zip(miss, old) for x in (c, "1" if v == "1" else "0")]])
+            _SW_CACHE.pop(kind, None)
 
     logging.info("boot ok | CHAT_IDS=%s | CHAT_IDS_POSITION=%s", CHAT_IDS, CHAT_IDS_POSITION)
 
 bootstrap()
+threading.Thread(target=_bg_worker, name="bg", daemon=True).start()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "10000")))
\ No newline at end of file
+    from gevent.pywsgi import WSGIServer
+    WSGIServer(("0.0.0.0", int(os.getenv("PORT", "10000"))), app).serve_forever()
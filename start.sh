@@ -1,2 +1,2 @@
 #!/usr/bin/env bash
-gunicorn app:app --bind 0.0.0.0:$PORT
\ No newline at end of file
+gunicorn -k gevent --worker-connections 200 app:app --bind 0.0.0.0:$PORT
\ No newline at end of file